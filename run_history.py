@@ -39,7 +39,7 @@ def main():
                 print(f"  Fetched {len(df)} candles")
                 
                 # Detect order blocks
-                blocks = detection.detect_order_blocks(df)
+                blocks = detection.detect_order_blocks(df, as_array=True)
                 bullish_count = len(blocks['bullish'])
                 bearish_count = len(blocks['bearish'])
                 print(f"  Detected {bullish_count} bullish and {bearish_count} bearish order blocks")
@@ -31,11 +31,25 @@ POLL_INTERVAL_SEC = 30
 # WebSocket live mode settings
 WS_MAX_BARS = 500  # Maximum number of bars to keep in WebSocket buffer
 WS_NOTIFY_SCORE_MIN = 0.25  # Minimum score threshold for WebSocket notifications
-STATE_FILE = 'data/state.json'  # Path to persistent state file
+WS_QUEUE_MAX = 1000  # Unprocessed closed klines to hold before the socket reader waits for detection
+WS_DETECT_WORKERS = 4  # Threads running order block detection for live buffers
+WS_NOTIFY_QUEUE_MAX = 1000  # Pending Telegram notifications before new ones wait for the next scan
+WS_NOTIFY_DRAIN_SEC = 10  # Time allowed at shutdown to send notifications still queued
+WS_PRELOAD_WORKERS = 8  # Concurrent REST requests when preloading historical klines
+STATE_FILE = 'data/state.json'  # Path to persistent state file (':memory:' disables persistence)
+STATE_SNAPSHOT_EVERY = 1000  # Rewrite the full state snapshot after this many newly seen blocks
+STATE_SNAPSHOT_INTERVAL_SEC = 10  # Also rewrite it when this many seconds passed since the last snapshot
+STATE_MAX_ENTRIES = 10000  # Exact dedup keys kept in memory; older ones move to the Bloom filter
+STATE_PRUNE_TO = 9000  # Keys kept after an automatic prune (the slack avoids pruning on every new block)
+STATE_BLOOM_BITS = 1 << 23  # Size of the Bloom filter holding pruned dedup keys (1 MiB on disk)
+STATE_BLOOM_HASHES = 6  # Bit positions set per key; ~2% false positives after 1M pruned keys
 
 # Number of days of historical data to fetch
 HISTORY_DAYS = 2
 
+# Maximum number of most recent candles drawn on a chart (older bars and their blocks are dropped; 0 = no limit)
+PLOT_MAX_BARS = 300
+
 # Strong move threshold for order block detection (multiplier)
 STRONG_MOVE_THRESHOLD = 1.5
 
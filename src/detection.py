@@ -2,12 +2,79 @@
 Order block detection module.
 Identifies bullish and bearish order blocks in price data with advanced features.
 """
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 import pandas as pd
 import numpy as np
 from . import config
 
 
+# Packed layout for order blocks (one record per block, ~30 bytes vs ~230 for a dict)
+BLOCK_DTYPE = np.dtype([
+    ('index', np.int32),
+    ('low', np.float64),
+    ('high', np.float64),
+    ('score', np.float32),
+    ('touches', np.int32),
+    ('has_sweep', np.bool_),
+    ('type', np.uint8),
+])
+
+# Codes stored in the 'type' field of BLOCK_DTYPE records
+BLOCK_TYPE_CODES = {'bullish': 0, 'bearish': 1}
+BLOCK_TYPE_NAMES = {code: name for name, code in BLOCK_TYPE_CODES.items()}
+
+# Rolling window for the average volume used in volume spike scoring
+VOLUME_AVG_WINDOW = 20
+
+
+def blocks_to_array(blocks: List[Dict]) -> np.ndarray:
+    """
+    Pack a list of order block dicts into a structured numpy array.
+    
+    Args:
+        blocks: List of block dicts (index, low, high, type, score, touches, has_sweep)
+        
+    Returns:
+        Structured array with dtype BLOCK_DTYPE
+    """
+    arr = np.empty(len(blocks), dtype=BLOCK_DTYPE)
+    for i, block in enumerate(blocks):
+        arr[i] = (
+            block['index'],
+            block['low'],
+            block['high'],
+            block.get('score', 0.5),
+            block.get('touches', 1),
+            block.get('has_sweep', False),
+            BLOCK_TYPE_CODES[block['type']],
+        )
+    return arr
+
+
+def array_to_blocks(arr: np.ndarray) -> List[Dict]:
+    """
+    Unpack a BLOCK_DTYPE structured array into legacy order block dicts.
+    
+    Args:
+        arr: Structured array with dtype BLOCK_DTYPE
+        
+    Returns:
+        List of block dicts
+    """
+    return [
+        {
+            'index': int(rec['index']),
+            'low': float(rec['low']),
+            'high': float(rec['high']),
+            'type': BLOCK_TYPE_NAMES[int(rec['type'])],
+            'score': float(rec['score']),
+            'touches': int(rec['touches']),
+            'has_sweep': bool(rec['has_sweep'])
+        }
+        for rec in arr
+    ]
+
+
 def calculate_atr(df: pd.DataFrame, period: int = 14) -> pd.Series:
     """
     Calculate Average True Range (ATR) for the given data.
@@ -328,6 +395,28 @@ def calculate_volume_spike(candle_volume: float, avg_volume: float) -> float:
     return candle_volume / avg_volume
 
 
+def detection_window(atr_period: int = None, expiry_bars: int = None) -> int:
+    """
+    Number of trailing candles needed to find every zone that is not yet expired.
+    
+    Zones older than expiry_bars are filtered out, and a candidate only needs
+    enough earlier candles to warm up its ATR and average volume, so running
+    detect_order_zones() on this many trailing candles finds the same live
+    zones as running it on a longer history (except that an expired zone can
+    no longer absorb an overlapping live one when merging).
+    
+    Args:
+        atr_period: ATR calculation period (default from config)
+        expiry_bars: Zone expiry period (default from config)
+        
+    Returns:
+        Number of candles
+    """
+    atr_period = atr_period or config.ATR_PERIOD
+    expiry_bars = expiry_bars or config.ZONE_EXPIRY_BARS
+    return expiry_bars + 1 + max(atr_period, VOLUME_AVG_WINDOW)
+
+
 def detect_order_zones(df: pd.DataFrame,
                       atr_period: int = None,
                       atr_mult: float = None,
@@ -394,7 +483,7 @@ def detect_order_zones(df: pd.DataFrame,
     atr = calculate_atr(df, atr_period)
     
     # Calculate average volume for spike detection
-    avg_volume = df['volume'].rolling(window=20).mean()
+    avg_volume = df['volume'].rolling(window=VOLUME_AVG_WINDOW).mean()
     
     # Scan for candidate candles
     for i in range(atr_period, len(df) - lookahead):
@@ -513,7 +602,8 @@ def detect_order_zones(df: pd.DataFrame,
     return zones
 
 
-def detect_order_blocks(df: pd.DataFrame, lookback: int = 20) -> Dict[str, List[Dict]]:
+def detect_order_blocks(df: pd.DataFrame, lookback: int = 20,
+                        as_array: bool = False) -> Dict[str, Union[List[Dict], np.ndarray]]:
     """
     Backward-compatible wrapper for detect_order_zones.
     
@@ -523,12 +613,22 @@ def detect_order_blocks(df: pd.DataFrame, lookback: int = 20) -> Dict[str, List[
     Args:
         df: DataFrame with OHLCV data
         lookback: Number of candles to look back (for compatibility, not used)
-        
+        as_array: If True, return each side as a BLOCK_DTYPE structured array
+                  instead of a list of dicts
+                  
     Returns:
-        Dict with 'bullish' and 'bearish' lists of order blocks
+        Dict with 'bullish' and 'bearish' lists of order blocks; with as_array=True
+        each value is instead a 1-D BLOCK_DTYPE structured array with one row per block
     """
     zones = detect_order_zones(df)
     
+    if as_array:
+        arr = blocks_to_array(zones)
+        return {
+            'bullish': arr[arr['type'] == BLOCK_TYPE_CODES['bullish']],
+            'bearish': arr[arr['type'] == BLOCK_TYPE_CODES['bearish']]
+        }
+    
     # Convert to old format
     blocks = {
         'bullish': [],
@@ -4,25 +4,104 @@ WebSocket-based live order block detection module.
 Connects to Binance WebSocket streams for real-time kline data.
 """
 import asyncio
+import concurrent.futures
+import hashlib
 import json
 import os
+import time
 import websockets
+import numpy as np
 import pandas as pd
 import requests
-from typing import Dict, Set, Tuple, Optional
+from typing import Any, Dict, KeysView, List, Set, Tuple, Optional, Union
 from datetime import datetime
-from collections import defaultdict, deque
+from itertools import chain, islice
+from types import MappingProxyType
 
 from . import config
 from . import detection
 from . import notifier
+from . import state
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
+try:
+    import uvloop
+except ImportError:  # Not installed, or Windows (unsupported)
+    uvloop = None
+
+
+def _loads(data: Union[str, bytes]) -> Any:
+    """
+    Decode a JSON frame or response body, using orjson when it is installed.
+    
+    orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers only
+    need to handle the latter.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 
+
+
+class Kline:
+    """
+    One candle parsed from a Binance kline payload.
+    
+    Prices and volume are converted to float once, when the payload is parsed.
+    """
+    
+    __slots__ = ('timestamp', 'open', 'high', 'low', 'close', 'volume', 'is_closed')
+    
+    def __init__(self, timestamp: int, open: float, high: float, low: float,
+                 close: float, volume: float, is_closed: bool = True):
+        """
+        Initialize a kline.
+        
+        Args:
+            timestamp: Candle open time in epoch milliseconds
+            open: Open price
+            high: High price
+            low: Low price
+            close: Close price
+            volume: Base asset volume
+            is_closed: Whether the candle is final
+        """
+        self.timestamp = timestamp
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.is_closed = is_closed
+    
+    @classmethod
+    def from_ws(cls, k: Dict) -> 'Kline':
+        """
+        Parse the `k` object of a Binance kline event.
+        
+        Args:
+            k: Kline payload with string prices (keys t, o, h, l, c, v, x)
+            
+        Returns:
+            Parsed Kline
+        """
+        return cls(k['t'], float(k['o']), float(k['h']), float(k['l']),
+                   float(k['c']), float(k['v']), k.get('x', True))
+
+
 class KlineBuffer:
-    """Manages a rolling buffer of klines for a symbol/timeframe pair."""
+    """
+    Manages a rolling buffer of klines for a symbol/timeframe pair.
+    
+    Candles are stored in fixed-size numpy column arrays used as a ring buffer,
+    so adding a kline is O(1) and allocates nothing.
+    """
     
     def __init__(self, max_candles: int = 200):
         """
@@ -32,42 +111,149 @@ class KlineBuffer:
             max_candles: Maximum number of candles to keep in buffer
         """
         self.max_candles = max_candles
-        self.klines = []
+        # Candles needed before detection can run: ATR warm-up plus the impulse lookahead
+        self.min_required = config.ATR_PERIOD + config.DETECTION_LOOKAHEAD + 1
+        # One column per field; timestamps are kept as integer epoch milliseconds
+        self._timestamp = np.empty(max_candles, dtype=np.int64)
+        self._open = np.empty(max_candles, dtype=np.float64)
+        self._high = np.empty(max_candles, dtype=np.float64)
+        self._low = np.empty(max_candles, dtype=np.float64)
+        self._close = np.empty(max_candles, dtype=np.float64)
+        self._volume = np.empty(max_candles, dtype=np.float64)
+        # Total number of klines ever written; the next slot is _idx % max_candles
+        self._idx = 0
+        # Frame over the raw columns (no copy), so get_dataframe() can hand out row slices
+        self._frame = pd.DataFrame({
+            'timestamp': self._timestamp.view('datetime64[ms]'),
+            'open': self._open,
+            'high': self._high,
+            'low': self._low,
+            'close': self._close,
+            'volume': self._volume
+        }, copy=False)
+    
+    def __len__(self) -> int:
+        """Number of candles currently held in the buffer."""
+        return min(self._idx, self.max_candles)
     
-    def add_kline(self, kline_data: Dict) -> None:
+    def add_kline(self, kline_data) -> None:
         """
         Add a closed kline to the buffer.
         
+        Once the buffer is full the oldest candle is overwritten.
+        
         Args:
-            kline_data: Kline data from WebSocket
+            kline_data: Parsed Kline, or raw kline data from WebSocket
         """
-        # Extract OHLCV data
-        kline = {
-            'timestamp': pd.to_datetime(kline_data['t'], unit='ms'),
-            'open': float(kline_data['o']),
-            'high': float(kline_data['h']),
-            'low': float(kline_data['l']),
-            'close': float(kline_data['c']),
-            'volume': float(kline_data['v'])
-        }
+        if not isinstance(kline_data, Kline):
+            kline_data = Kline.from_ws(kline_data)
+        pos = self._idx % self.max_candles
+        self._timestamp[pos] = kline_data.timestamp
+        self._open[pos] = kline_data.open
+        self._high[pos] = kline_data.high
+        self._low[pos] = kline_data.low
+        self._close[pos] = kline_data.close
+        self._volume[pos] = kline_data.volume
+        self._idx += 1
+    
+    def add_klines_bulk(self, rows: List[Dict]) -> None:
+        """
+        Add several closed klines at once, oldest first.
         
-        # Add to buffer
-        self.klines.append(kline)
+        Equivalent to calling add_kline() for each row, but each column is
+        converted and written with a single numpy operation.
         
-        # Keep only max_candles most recent
-        if len(self.klines) > self.max_candles:
-            self.klines = self.klines[-self.max_candles:]
+        Args:
+            rows: Raw kline data from WebSocket or REST (keys t, o, h, l, c, v)
+        """
+        # Only the newest max_candles rows would survive anyway
+        rows = rows[max(len(rows) - self.max_candles, 0):]
+        self._add_columns(
+            len(rows),
+            [row['t'] for row in rows],
+            # numpy parses the numeric strings while filling the float columns
+            np.array([row['o'] for row in rows], dtype=np.float64),
+            np.array([row['h'] for row in rows], dtype=np.float64),
+            np.array([row['l'] for row in rows], dtype=np.float64),
+            np.array([row['c'] for row in rows], dtype=np.float64),
+            np.array([row['v'] for row in rows], dtype=np.float64),
+        )
+    
+    def add_dataframe(self, df: pd.DataFrame) -> None:
+        """
+        Add the candles of an OHLCV DataFrame at once, oldest first.
+        
+        Args:
+            df: DataFrame with timestamp, open, high, low, close and volume columns,
+                as returned by BinanceWebSocketClient.fetch_historical_klines()
+        """
+        df = df.iloc[max(len(df) - self.max_candles, 0):]
+        self._add_columns(
+            len(df),
+            df['timestamp'].to_numpy().astype('datetime64[ms]').view(np.int64),
+            df['open'].to_numpy(),
+            df['high'].to_numpy(),
+            df['low'].to_numpy(),
+            df['close'].to_numpy(),
+            df['volume'].to_numpy(),
+        )
+    
+    def _add_columns(self, count: int, timestamp, open_, high, low, close, volume) -> None:
+        """
+        Write `count` candles given as columns into the next slots of the ring.
+        
+        Callers drop all but the newest max_candles rows before converting them,
+        since older rows would be overwritten within the same call.
+        """
+        if not count:
+            return
+        
+        pos = (self._idx + np.arange(count)) % self.max_candles
+        self._timestamp[pos] = timestamp
+        self._open[pos] = open_
+        self._high[pos] = high
+        self._low[pos] = low
+        self._close[pos] = close
+        self._volume[pos] = volume
+        self._idx += count
     
-    def get_dataframe(self) -> pd.DataFrame:
+    def _end(self) -> int:
+        """Slot just past the newest candle."""
+        end = self._idx % self.max_candles
+        if end == 0 and self._idx:
+            end = self.max_candles
+        return end
+    
+    def get_dataframe(self, last_n: Optional[int] = None) -> pd.DataFrame:
         """
         Get the buffer as a DataFrame.
         
+        Unless the requested candles wrap around the end of the ring, the
+        returned frame is a row slice of a frame over the buffer's own arrays,
+        so it is only guaranteed to be stable until the next call to add_kline().
+        
+        Args:
+            last_n: Only include the most recent last_n candles (default: all)
+            
         Returns:
             DataFrame with OHLCV data
         """
-        if not self.klines:
+        if self._idx == 0:
             return pd.DataFrame()
-        return pd.DataFrame(self.klines)
+        count = len(self) if last_n is None else min(last_n, len(self))
+        end = self._end()
+        start = end - count
+        
+        if start >= 0:
+            df = self._frame.iloc[start:end]
+            df.index = pd.RangeIndex(count)
+            return df
+        
+        # Wrapped: stitch the tail and head of each column together
+        return pd.DataFrame({
+            name: np.concatenate((column[start:], column[:end]))
+            for name, column in self._frame.items()
+        }, copy=False)
     
     def is_ready(self) -> bool:
         """
@@ -76,54 +262,233 @@ class KlineBuffer:
         Returns:
             True if buffer has sufficient data
         """
-        # Need at least ATR_PERIOD + DETECTION_LOOKAHEAD + 1 candles
-        min_required = config.ATR_PERIOD + config.DETECTION_LOOKAHEAD + 1
-        return len(self.klines) >= min_required
+        return len(self) >= self.min_required
+
+
+def make_block_key(symbol: str, timeframe: str, index: int, block_type: str, score: float) -> str:
+    """
+    Build the deduplication key for an order block.
+    
+    Format: symbol|timeframe|index|type|score, with the score rounded to 2 decimals.
+    
+    Args:
+        symbol: Trading pair (e.g., "BTC/USDT")
+        timeframe: Timeframe (e.g., "15m")
+        index: Candle index of the block within the buffer
+        block_type: 'bullish' or 'bearish'
+        score: Block confidence score
+        
+    Returns:
+        Unique block identifier
+    """
+    return f"{symbol}|{timeframe}|{index}|{block_type}|{round(score, 2)}"
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over string keys, backed by a numpy bit array.
+    
+    Membership tests can return false positives but never false negatives,
+    and the memory (and on-disk) footprint does not grow with the number of keys.
+    """
+    
+    def __init__(self, num_bits: int, num_hashes: int):
+        """
+        Initialize an empty filter.
+        
+        Args:
+            num_bits: Number of bits in the filter (rounded up to a whole byte)
+            num_hashes: Number of bit positions set per key
+        """
+        self.num_bits = (num_bits + 7) // 8 * 8
+        self.num_hashes = num_hashes
+        self._bits = np.zeros(self.num_bits // 8, dtype=np.uint8)
+        self.dirty = False  # Set when bits changed since the last save()
+        self.empty = True  # No bit set yet, so every lookup is a miss
+    
+    def _positions(self, key: str) -> np.ndarray:
+        """
+        Bit positions for a key, derived from one digest by double hashing.
+        
+        Args:
+            key: Key to hash
+            
+        Returns:
+            Array of num_hashes bit positions
+        """
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return np.array([(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)],
+                        dtype=np.int64)
+    
+    def add(self, key: str) -> None:
+        """
+        Add a key to the filter.
+        
+        Args:
+            key: Key to add
+        """
+        pos = self._positions(key)
+        np.bitwise_or.at(self._bits, pos >> 3, (1 << (pos & 7)).astype(np.uint8))
+        self.dirty = True
+        self.empty = False
+    
+    def __contains__(self, key: str) -> bool:
+        """Whether the key was probably added (never False for an added key)."""
+        # Until the first prune the filter is empty; skip hashing the key
+        if self.empty:
+            return False
+        pos = self._positions(key)
+        return bool(np.all(self._bits[pos >> 3] & (1 << (pos & 7))))
+    
+    def load(self, path: str) -> None:
+        """
+        Load the bit array from disk, keeping the filter empty if the file is
+        missing or was written with a different size.
+        
+        Args:
+            path: Path to the filter file
+        """
+        try:
+            bits = np.fromfile(path, dtype=np.uint8)
+        except FileNotFoundError:
+            return
+        if bits.size == self._bits.size:
+            self._bits = bits
+            self.empty = not bits.any()
+        else:
+            print(f"Warning: Ignoring Bloom filter {path} with unexpected size {bits.size}")
+        self.dirty = False
+    
+    def save(self, path: str) -> None:
+        """
+        Atomically write the bit array to disk.
+        
+        Args:
+            path: Path to the filter file
+        """
+        # Only called when bits changed, so comparing with the 1 MiB file on disk is wasted work
+        state.save_bytes(path, self._bits.tobytes(), skip_unchanged=False)
+        self.dirty = False
 
 
 class DeduplicationState:
-    """Manages persistent deduplication state across restarts."""
+    """
+    Manages persistent deduplication state across restarts.
+    
+    Newly seen keys are appended to a write-ahead log (`<state_file>.log`);
+    the full JSON snapshot is only rewritten every STATE_SNAPSHOT_EVERY marks
+    or STATE_SNAPSHOT_INTERVAL_SEC seconds, after which the log is discarded.
+    
+    Keys removed by prune_old_entries() move into a fixed-size Bloom filter
+    (`<state_file>.bloom`), so the JSON snapshot stays bounded while pruned
+    blocks are still recognised as seen (rarely, an unseen block is reported
+    as seen too, which only suppresses a notification).
+    """
     
     def __init__(self, state_file: str):
         """
         Initialize deduplication state.
         
         Args:
-            state_file: Path to state file
+            state_file: Path to state file, or ':memory:' to keep state in memory only
         """
         self.state_file = state_file
-        # Use deque to maintain order for pruning
-        self.seen_blocks: deque = deque()
-        self.seen_set: Set[str] = set()  # For fast lookup
+        self._persist = state_file != ':memory:'
+        self.log_file = f"{state_file}.log"
+        self.bloom_file = f"{state_file}.bloom"
+        # Insertion-ordered dict: O(1) lookup and FIFO order for pruning in one structure
+        self._seen: Dict[str, None] = {}
+        # Pruned keys; only ever grows, but has a fixed size
+        self._bloom = BloomFilter(config.STATE_BLOOM_BITS, config.STATE_BLOOM_HASHES)
+        self._log = None  # Append handle for the write-ahead log, opened lazily
+        self._unsnapshotted = 0  # Keys written to the log since the last snapshot
+        self._last_snapshot = time.monotonic()
         self.load_state()
     
+    def __len__(self) -> int:
+        """Number of seen blocks."""
+        return len(self._seen)
+    
+    @property
+    def seen_blocks(self) -> List[str]:
+        """Seen block keys, oldest first."""
+        return list(self._seen)
+    
+    @property
+    def seen_set(self) -> KeysView:
+        """Read-only set-like view of the seen block keys."""
+        return self._seen.keys()
+    
     def load_state(self) -> None:
-        """Load state from file if it exists."""
-        if os.path.exists(self.state_file):
+        """Load the snapshot, the Bloom filter and replay the write-ahead log if they exist."""
+        if not self._persist:
+            return
+        try:
+            self._bloom.load(self.bloom_file)
+            blocks = state.load_state(self.state_file).get('seen_blocks', [])
             try:
-                with open(self.state_file, 'r') as f:
-                    data = json.load(f)
-                    blocks = data.get('seen_blocks', [])
-                    self.seen_blocks = deque(blocks)
-                    self.seen_set = set(blocks)
-                print(f"Loaded {len(self.seen_blocks)} seen blocks from state file")
-            except Exception as e:
-                print(f"Warning: Could not load state file: {e}")
-                self.seen_blocks = deque()
-                self.seen_set = set()
+                with open(self.log_file, 'r') as f:
+                    blocks.extend(line.rstrip('\n') for line in f if line.strip())
+            except FileNotFoundError:
+                pass
+            
+            self._seen = dict.fromkeys(blocks)
+            if self._seen:
+                print(f"Loaded {len(self._seen)} seen blocks from state file")
+        except Exception as e:
+            print(f"Warning: Could not load state file: {e}")
+            self._seen = {}
     
     def save_state(self) -> None:
-        """Save state to file."""
+        """Write a full snapshot of the state and discard the write-ahead log."""
+        if not self._persist:
+            return
         try:
+            # Write the filter first so pruned keys are never missing from both files
+            if self._bloom.dirty:
+                self._bloom.save(self.bloom_file)
             data = {
-                'seen_blocks': list(self.seen_blocks),
+                'seen_blocks': list(self._seen),
                 'last_updated': datetime.now().isoformat()
             }
-            with open(self.state_file, 'w') as f:
-                json.dump(data, f, indent=2)
+            state.save_state(self.state_file, data)
+            
+            # Everything in the log is now covered by the snapshot
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            if os.path.exists(self.log_file):
+                os.remove(self.log_file)
+            self._unsnapshotted = 0
+            self._last_snapshot = time.monotonic()
         except Exception as e:
             print(f"Warning: Could not save state file: {e}")
     
+    def flush(self) -> None:
+        """Write a snapshot if anything changed since the last one (e.g. at shutdown)."""
+        if self._unsnapshotted or self._bloom.dirty:
+            self.save_state()
+    
+    def _append_log(self, block_key: str) -> None:
+        """
+        Append a newly seen key to the write-ahead log.
+        
+        Args:
+            block_key: Unique block identifier
+        """
+        try:
+            if self._log is None:
+                parent_dir = os.path.dirname(self.log_file)
+                if parent_dir:
+                    os.makedirs(parent_dir, exist_ok=True)
+                # Line buffered so every key reaches the OS as soon as it is written
+                self._log = open(self.log_file, 'a', buffering=1)
+            self._log.write(block_key + '\n')
+        except Exception as e:
+            print(f"Warning: Could not append to state log: {e}")
+    
     def is_seen(self, block_key: str) -> bool:
         """
         Check if a block has been seen.
@@ -132,9 +497,9 @@ class DeduplicationState:
             block_key: Unique block identifier
             
         Returns:
-            True if block was seen before
+            True if block was seen before (or, rarely, a Bloom filter false positive)
         """
-        return block_key in self.seen_set
+        return block_key in self._seen or block_key in self._bloom
     
     def mark_seen(self, block_key: str) -> None:
         """
@@ -143,27 +508,40 @@ class DeduplicationState:
         Args:
             block_key: Unique block identifier
         """
-        if block_key not in self.seen_set:
-            self.seen_blocks.append(block_key)
-            self.seen_set.add(block_key)
+        if block_key in self._seen:
+            return
+        self._seen[block_key] = None
+        if self._persist:
+            self._append_log(block_key)
+            self._unsnapshotted += 1
+        
+        # Keep the exact set bounded; pruning below the cap means it runs once per many marks
+        if len(self._seen) > config.STATE_MAX_ENTRIES:
+            self.prune_old_entries(config.STATE_PRUNE_TO)
+        # Debounced snapshot: compact the log once enough keys or time accumulated
+        elif self._persist and (self._unsnapshotted >= config.STATE_SNAPSHOT_EVERY or
+                                time.monotonic() - self._last_snapshot >= config.STATE_SNAPSHOT_INTERVAL_SEC):
             self.save_state()
     
-    def prune_old_entries(self, max_entries: int = 10000) -> None:
+    def prune_old_entries(self, max_entries: int = None) -> None:
         """
         Prune old entries if state grows too large.
-        Removes oldest entries first (FIFO).
+        Removes oldest entries first (FIFO) and adds them to the Bloom filter.
+        
+        mark_seen() calls this automatically once STATE_MAX_ENTRIES is exceeded.
         
         Args:
-            max_entries: Maximum number of entries to keep
+            max_entries: Maximum number of entries to keep (defaults to config.STATE_MAX_ENTRIES)
         """
-        if len(self.seen_blocks) > max_entries:
-            # Remove oldest entries
-            to_remove = len(self.seen_blocks) - max_entries
-            print(f"State file too large ({len(self.seen_blocks)} entries), removing {to_remove} oldest entries...")
-            for _ in range(to_remove):
-                if self.seen_blocks:
-                    old_key = self.seen_blocks.popleft()
-                    self.seen_set.discard(old_key)
+        if max_entries is None:
+            max_entries = config.STATE_MAX_ENTRIES
+        if len(self._seen) > max_entries:
+            # Remove oldest entries (dict iteration order is insertion order)
+            to_remove = len(self._seen) - max_entries
+            print(f"State file too large ({len(self._seen)} entries), removing {to_remove} oldest entries...")
+            for old_key in list(islice(self._seen, to_remove)):
+                del self._seen[old_key]
+                self._bloom.add(old_key)
             self.save_state()
 
 
@@ -184,6 +562,31 @@ class BinanceWebSocketClient:
         self.max_bars = max_bars or config.WS_MAX_BARS
         self.buffers: Dict[Tuple[str, str], KlineBuffer] = {}
         self.dedup_state = DeduplicationState(config.STATE_FILE)
+        # Detection runs here so pandas/numpy work doesn't block the event loop
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=config.WS_DETECT_WORKERS)
+        self._detect_window = detection.detection_window()
+        
+        # (block key, message) pairs waiting for the sender task; None sends inline (no listener running)
+        self._notify_queue: Optional[asyncio.Queue] = None
+        # Keys of queued blocks; they are only marked seen once the sender has handled them
+        self._pending_keys: Set[str] = set()
+        # Open time of the last closed kline received for each (symbol, timeframe)
+        self._last_t: Dict[Tuple[str, str], int] = {}
+        # Binance stream symbol -> configured symbol, e.g. "btcusdt" -> "BTC/USDT"
+        # Read-only, since the reader and consumer tasks both look symbols up in it
+        self._symbol_by_stream = MappingProxyType(
+            {symbol.replace('/', '').lower(): symbol for symbol in symbols}
+        )
+        
+        # Symbols and timeframes are fixed for the client's lifetime, so build the streams once
+        # Stream name format: btcusdt@kline_15m -> ("BTC/USDT", "15m")
+        self._pair_by_stream_name = MappingProxyType({
+            f"{binance_symbol}@kline_{timeframe}": (symbol, timeframe)
+            for binance_symbol, symbol in self._symbol_by_stream.items()
+            for timeframe in timeframes
+        })
+        self._stream_names = tuple(self._pair_by_stream_name)
+        self._ws_url = f"wss://stream.binance.com:9443/stream?streams={'/'.join(self._stream_names)}"
         
         # Initialize buffers for each symbol/timeframe pair
         for symbol in symbols:
@@ -191,33 +594,23 @@ class BinanceWebSocketClient:
                 key = (symbol, timeframe)
                 self.buffers[key] = KlineBuffer(max_candles=self.max_bars)
     
-    def get_stream_names(self) -> list:
+    def get_stream_names(self) -> Tuple[str, ...]:
         """
-        Generate WebSocket stream names for all symbol/timeframe pairs.
+        Get WebSocket stream names for all symbol/timeframe pairs.
         
         Returns:
-            List of stream names
-        """
-        streams = []
-        for symbol in self.symbols:
-            # Convert symbol format: "BTC/USDT" -> "btcusdt"
-            binance_symbol = symbol.replace('/', '').lower()
-            for timeframe in self.timeframes:
-                # Stream name format: btcusdt@kline_15m
-                stream_name = f"{binance_symbol}@kline_{timeframe}"
-                streams.append(stream_name)
-        return streams
+            Tuple of stream names
+        """
+        return self._stream_names
     
     def get_websocket_url(self) -> str:
         """
-        Build WebSocket URL with combined streams.
+        Get the WebSocket URL with combined streams.
         
         Returns:
             WebSocket URL
         """
-        streams = self.get_stream_names()
-        streams_param = '/'.join(streams)
-        return f"wss://stream.binance.com:9443/stream?streams={streams_param}"
+        return self._ws_url
     
     def parse_symbol_from_stream(self, stream_name: str) -> Tuple[str, str]:
         """
@@ -229,26 +622,26 @@ class BinanceWebSocketClient:
         Returns:
             Tuple of (symbol, timeframe)
         """
+        # Subscribed streams are known up front
+        pair = self._pair_by_stream_name.get(stream_name)
+        if pair is not None:
+            return pair
+        
         # Parse stream name: "btcusdt@kline_15m" -> ("BTC/USDT", "15m")
-        parts = stream_name.split('@')
-        if len(parts) != 2:
+        binance_symbol, sep, kline_part = stream_name.partition('@')  # kline_part: "kline_15m"
+        if not sep or '@' in kline_part:
             raise ValueError(f"Invalid stream name: {stream_name}")
         
-        binance_symbol = parts[0]
-        kline_part = parts[1]  # "kline_15m"
-        
         # Extract timeframe
-        if not kline_part.startswith('kline_'):
+        prefix, sep, timeframe = kline_part.partition('_')
+        if prefix != 'kline' or not sep:
             raise ValueError(f"Invalid kline stream: {kline_part}")
-        timeframe = kline_part.replace('kline_', '')
         
         # Find matching symbol from config
-        # Try to match by converting to lowercase and removing /
-        for symbol in self.symbols:
-            if symbol.replace('/', '').lower() == binance_symbol:
-                return (symbol, timeframe)
-        
-        raise ValueError(f"Unknown symbol: {binance_symbol}")
+        try:
+            return (self._symbol_by_stream[binance_symbol], timeframe)
+        except KeyError:
+            raise ValueError(f"Unknown symbol: {binance_symbol}") from None
     
     def fetch_historical_klines(self, symbol: str, timeframe: str, limit: int = None) -> pd.DataFrame:
         """
@@ -279,29 +672,25 @@ class BinanceWebSocketClient:
         try:
             response = requests.get(url, params=params, timeout=10)
             response.raise_for_status()
-            klines = response.json()
+            klines = _loads(response.content)
             
             # Convert to DataFrame
             # Binance kline format: [open_time, open, high, low, close, volume, close_time, ...]
             if not klines:
                 return pd.DataFrame()
             
-            df = pd.DataFrame(klines, columns=[
-                'open_time', 'open', 'high', 'low', 'close', 'volume',
-                'close_time', 'quote_volume', 'trades', 'taker_buy_base',
-                'taker_buy_quote', 'ignore'
-            ])
+            # Convert only the needed columns, each in one vectorized cast
+            rows = np.array(klines, dtype=object)
+            ohlcv = rows[:, 1:6].astype(np.float64)
             
-            # Convert types and select only needed columns
-            df['timestamp'] = pd.to_datetime(df['open_time'], unit='ms')
-            df['open'] = df['open'].astype(float)
-            df['high'] = df['high'].astype(float)
-            df['low'] = df['low'].astype(float)
-            df['close'] = df['close'].astype(float)
-            df['volume'] = df['volume'].astype(float)
-            
-            # Return only OHLCV columns
-            return df[['timestamp', 'open', 'high', 'low', 'close', 'volume']]
+            return pd.DataFrame({
+                'timestamp': pd.to_datetime(rows[:, 0].astype(np.int64), unit='ms'),
+                'open': ohlcv[:, 0],
+                'high': ohlcv[:, 1],
+                'low': ohlcv[:, 2],
+                'close': ohlcv[:, 3],
+                'volume': ohlcv[:, 4],
+            })
         
         except Exception as e:
             print(f"Error fetching historical klines for {symbol} {timeframe}: {e}")
@@ -319,165 +708,319 @@ class BinanceWebSocketClient:
         print("Preloading historical data...")
         print("=" * 60)
         
-        for symbol in self.symbols:
-            for timeframe in self.timeframes:
-                buffer_key = (symbol, timeframe)
-                
-                print(f"[{symbol} {timeframe}] Fetching {self.max_bars} historical klines...")
-                
-                # Fetch historical data
-                df = self.fetch_historical_klines(symbol, timeframe, self.max_bars)
-                
-                if df.empty:
-                    print(f"[{symbol} {timeframe}] Warning: No historical data fetched")
+        buffer_keys = [(symbol, timeframe) for symbol in self.symbols for timeframe in self.timeframes]
+        print(f"Fetching {self.max_bars} historical klines for {len(buffer_keys)} streams...")
+        
+        # Fetch all streams concurrently; the wall time is the slowest request, not the sum
+        with concurrent.futures.ThreadPoolExecutor(max_workers=config.WS_PRELOAD_WORKERS) as pool:
+            frames = list(pool.map(
+                lambda key: self.fetch_historical_klines(key[0], key[1], self.max_bars),
+                buffer_keys
+            ))
+        
+        for buffer_key, df in zip(buffer_keys, frames):
+            symbol, timeframe = buffer_key
+            if df.empty:
+                print(f"[{symbol} {timeframe}] Warning: No historical data fetched")
+                continue
+            
+            print(f"[{symbol} {timeframe}] Fetched {len(df)} klines")
+            
+            # Populate buffer with historical data
+            buffer = self.buffers[buffer_key]
+            buffer.add_dataframe(df)
+            
+            # Check if buffer is ready for detection
+            if not buffer.is_ready():
+                print(f"[{symbol} {timeframe}] Buffer not ready for detection (need {buffer.min_required} candles)")
+                continue
+            
+            # Run detection on historical data
+            print(f"[{symbol} {timeframe}] Running detection on historical data...")
+            # Same window as live scans, so both report the same keys for the same bars
+            blocks = self._detect_buffer(buffer)
+            
+            # Process detected blocks
+            threshold = config.WS_NOTIFY_SCORE_MIN
+            historical_blocks_count = 0
+            notified_count = 0
+            
+            for block in chain(blocks['bullish'], blocks['bearish']):
+                # Skip blocks below minimum score threshold
+                score = block.get('score', 0.5)
+                if score < threshold:
                     continue
                 
-                print(f"[{symbol} {timeframe}] Fetched {len(df)} klines")
+                # Create unique key for deduplication
+                block_key = make_block_key(symbol, timeframe, block['index'], block['type'], score)
                 
-                # Populate buffer with historical data
-                buffer = self.buffers[buffer_key]
-                for _, row in df.iterrows():
-                    # Convert DataFrame row to kline format expected by buffer
-                    kline_data = {
-                        't': int(row['timestamp'].timestamp() * 1000),
-                        'o': str(row['open']),
-                        'h': str(row['high']),
-                        'l': str(row['low']),
-                        'c': str(row['close']),
-                        'v': str(row['volume'])
-                    }
-                    buffer.add_kline(kline_data)
-                
-                # Check if buffer is ready for detection
-                if not buffer.is_ready():
-                    print(f"[{symbol} {timeframe}] Buffer not ready for detection (need {config.ATR_PERIOD + config.DETECTION_LOOKAHEAD + 1} candles)")
+                # Check if already seen
+                if self.dedup_state.is_seen(block_key):
                     continue
                 
-                # Run detection on historical data
-                print(f"[{symbol} {timeframe}] Running detection on historical data...")
-                df_buffer = buffer.get_dataframe()
-                blocks = detection.detect_order_blocks(df_buffer)
-                
-                # Process detected blocks
-                all_blocks = blocks['bullish'] + blocks['bearish']
-                historical_blocks_count = 0
-                notified_count = 0
-                
-                for block in all_blocks:
-                    # Create unique key for deduplication
-                    score = block.get('score', 0.5)
-                    score_rounded = round(score, 2)
-                    
-                    # Skip blocks below minimum score threshold
-                    if score < config.WS_NOTIFY_SCORE_MIN:
-                        continue
-                    
-                    block_key = f"{symbol}|{timeframe}|{block['index']}|{block['type']}|{score_rounded}"
-                    
-                    # Check if already seen
-                    if self.dedup_state.is_seen(block_key):
-                        continue
-                    
-                    historical_blocks_count += 1
-                    
-                    if send_historical:
-                        # Send notification for historical block
-                        message_text = notifier.format_block_message(symbol, timeframe, block)
-                        print(f"[{symbol} {timeframe}] Historical {block['type']} order block at index {block['index']} (score: {score:.2f})")
-                        notifier.send_telegram(message_text)
-                        notified_count += 1
-                    
-                    # Mark as seen
-                    self.dedup_state.mark_seen(block_key)
+                historical_blocks_count += 1
                 
                 if send_historical:
-                    print(f"[{symbol} {timeframe}] Sent {notified_count} historical notifications")
-                else:
-                    print(f"[{symbol} {timeframe}] Marked {historical_blocks_count} historical blocks as seen (no notifications)")
+                    # Send notification for historical block
+                    message_text = notifier.format_block_message(symbol, timeframe, block)
+                    print(f"[{symbol} {timeframe}] Historical {block['type']} order block at index {block['index']} (score: {score:.2f})")
+                    notifier.send_telegram(message_text)
+                    notified_count += 1
+                
+                # Mark as seen
+                self.dedup_state.mark_seen(block_key)
+            
+            if send_historical:
+                print(f"[{symbol} {timeframe}] Sent {notified_count} historical notifications")
+            else:
+                print(f"[{symbol} {timeframe}] Marked {historical_blocks_count} historical blocks as seen (no notifications)")
         
         # Save state after preloading
-        self.dedup_state.save_state()
+        self.dedup_state.flush()
         
         print("=" * 60)
         print("Historical data preloading complete!")
         print("=" * 60)
         print()
     
-    async def process_kline(self, message: Dict) -> None:
+    def _ingest(self, message: Dict) -> Optional[Tuple[str, str]]:
         """
-        Process a kline message from WebSocket.
+        Add the closed kline carried by a WebSocket message to its buffer.
         
         Args:
             message: WebSocket message
-        """
-        try:
-            # Extract kline data
-            stream_name = message.get('stream', '')
-            data = message.get('data', {})
-            kline = data.get('k', {})
             
-            # Only process closed klines
-            is_closed = kline.get('x', False)
-            if not is_closed:
-                return
+        Returns:
+            The (symbol, timeframe) buffer key, or None if the message was ignored
+        """
+        # Extract kline data
+        stream_name = message.get('stream', '')
+        data = message.get('data', {})
+        kline_data = data.get('k', {})
+        
+        # Only process closed klines
+        if not kline_data.get('x', False):
+            return None
+        kline = Kline.from_ws(kline_data)
+        
+        # Parse symbol and timeframe
+        symbol, timeframe = self.parse_symbol_from_stream(stream_name)
+        
+        # Get buffer for this pair
+        buffer_key = (symbol, timeframe)
+        buffer = self.buffers.get(buffer_key)
+        if buffer is None:
+            return None
+        
+        # Binance can resend the closing frame of a candle (e.g. after a reconnect)
+        if self._last_t.get(buffer_key) == kline.timestamp:
+            return None
+        self._last_t[buffer_key] = kline.timestamp
+        
+        # Add kline to buffer
+        buffer.add_kline(kline)
+        return buffer_key
+    
+    def _detect_buffer(self, buffer: KlineBuffer) -> Dict[str, List[Dict]]:
+        """
+        Detect order blocks in the trailing detection window of a buffer.
+        
+        Both the historical preload and live scans go through here, so the same
+        bars always yield the same blocks (and dedup keys).
+        
+        Args:
+            buffer: Buffer to scan
             
-            # Parse symbol and timeframe
-            symbol, timeframe = self.parse_symbol_from_stream(stream_name)
+        Returns:
+            Dictionary with 'bullish' and 'bearish' block lists, indices relative to the whole buffer
+        """
+        # Only the trailing window can contain unexpired blocks, so skip the older candles
+        df = buffer.get_dataframe(last_n=self._detect_window)
+        offset = len(buffer) - len(df)
+        blocks = detection.detect_order_blocks(df)
+        
+        # Report indices relative to the whole buffer, as dedup keys expect
+        if offset:
+            for block in chain(blocks['bullish'], blocks['bearish']):
+                block['index'] += offset
+        return blocks
+    
+    async def _detect(self, buffer_key: Tuple[str, str]) -> None:
+        """
+        Run detection on a buffer and notify about blocks that weren't seen yet.
+        
+        Args:
+            buffer_key: (symbol, timeframe) of the buffer to scan
+        """
+        symbol, timeframe = buffer_key
+        buffer = self.buffers[buffer_key]
+        
+        # Check if buffer has enough data for detection
+        if not buffer.is_ready():
+            print(f"[{symbol} {timeframe}] Buffering data... ({len(buffer)} candles)")
+            return
+        
+        # Detect order blocks off the event loop; the buffer is not written to
+        # until this returns because the consumer awaits it before the next batch
+        loop = asyncio.get_running_loop()
+        blocks = await loop.run_in_executor(self._pool, self._detect_buffer, buffer)
+        
+        # Process all detected blocks
+        threshold = config.WS_NOTIFY_SCORE_MIN
+        messages = []
+        
+        for block in chain(blocks['bullish'], blocks['bearish']):
+            # Skip blocks below minimum score threshold
+            score = block.get('score', 0.5)
+            if score < threshold:
+                continue
             
-            # Get buffer for this pair
-            buffer_key = (symbol, timeframe)
-            buffer = self.buffers.get(buffer_key)
-            if not buffer:
-                return
+            # Create unique key for deduplication
+            block_key = make_block_key(symbol, timeframe, block['index'], block['type'], score)
             
-            # Add kline to buffer
-            buffer.add_kline(kline)
+            # Check if already seen (or already waiting to be sent)
+            if self.dedup_state.is_seen(block_key) or block_key in self._pending_keys:
+                continue
             
-            # Check if buffer has enough data for detection
-            if not buffer.is_ready():
-                print(f"[{symbol} {timeframe}] Buffering data... ({len(buffer.klines)} candles)")
-                return
+            message_text = notifier.format_block_message(symbol, timeframe, block)
+            print(f"\n[{symbol} {timeframe}] New {block['type']} order block detected at index {block['index']} (score: {score:.2f})")
             
-            # Get DataFrame from buffer
-            df = buffer.get_dataframe()
+            if self._notify_queue is None:
+                # Mark as seen
+                self.dedup_state.mark_seen(block_key)
+                messages.append(message_text)
+            else:
+                # The sender task delivers it; a slow Telegram API must not hold up the next batch
+                self._queue_notification(block_key, message_text)
+        
+        if messages:
+            await self._send_notifications(messages)
+    
+    def _queue_notification(self, block_key: str, message_text: str) -> bool:
+        """
+        Hand a notification to the sender task.
+        
+        The block is marked seen by the sender once the message was sent, so a
+        notification dropped here (queue full) is retried on the next scan.
+        
+        Args:
+            block_key: Deduplication key of the block
+            message_text: Formatted Telegram message
             
-            # Detect order blocks
-            blocks = detection.detect_order_blocks(df)
+        Returns:
+            True if the notification was queued
+        """
+        try:
+            self._notify_queue.put_nowait((block_key, message_text))
+        except asyncio.QueueFull:
+            print("Warning: notification queue full, retrying the notification on the next scan")
+            return False
+        self._pending_keys.add(block_key)
+        return True
+    
+    async def _send_notifications(self, messages: List[str]) -> None:
+        """
+        Send notifications concurrently; requests are blocking, so they run on the default executor.
+        
+        Args:
+            messages: Formatted Telegram messages
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(None, notifier.send_telegram, message_text) for message_text in messages),
+            return_exceptions=True
+        )
+    
+    async def _notify_worker(self, queue: asyncio.Queue) -> None:
+        """
+        Send queued notifications forever, whatever has accumulated at once,
+        marking each block seen after its message was sent.
+        
+        Args:
+            queue: Queue filled by _queue_notification()
+        """
+        while True:
+            items = [await queue.get()]
+            while not queue.empty():
+                items.append(queue.get_nowait())
             
-            # Process all detected blocks
-            all_blocks = blocks['bullish'] + blocks['bearish']
+            await self._send_notifications([message_text for _, message_text in items])
             
-            for block in all_blocks:
-                # Create unique key for deduplication using pipe delimiter
-                # Format: symbol|timeframe|index|type|score
-                score = block.get('score', 0.5)
-                score_rounded = round(score, 2)
-                
-                # Skip blocks below minimum score threshold
-                if score < config.WS_NOTIFY_SCORE_MIN:
-                    continue
-                
-                block_key = f"{symbol}|{timeframe}|{block['index']}|{block['type']}|{score_rounded}"
-                
-                # Check if already seen
-                if self.dedup_state.is_seen(block_key):
-                    continue
-                
-                # Mark as seen
+            for block_key, _ in items:
                 self.dedup_state.mark_seen(block_key)
-                
-                # Send notification
-                message_text = notifier.format_block_message(symbol, timeframe, block)
-                print(f"\n[{symbol} {timeframe}] New {block['type']} order block detected at index {block['index']} (score: {score:.2f})")
-                notifier.send_telegram(message_text)
-            
-            # Periodically prune state file
-            if len(self.dedup_state.seen_set) > 10000:
-                self.dedup_state.prune_old_entries()
+                self._pending_keys.discard(block_key)
+                queue.task_done()
+    
+    async def process_kline(self, message: Dict) -> None:
+        """
+        Process a kline message from WebSocket.
+        
+        Args:
+            message: WebSocket message
+        """
+        try:
+            buffer_key = self._ingest(message)
+            if buffer_key is not None:
+                await self._detect(buffer_key)
         
         except Exception as e:
             print(f"Error processing kline: {e}")
     
+    async def process_batch(self, messages: List[Dict]) -> None:
+        """
+        Process several kline messages, running detection once per touched buffer.
+        
+        Args:
+            messages: WebSocket messages in arrival order
+        """
+        # Insertion-ordered so buffers are scanned in the order they were first updated
+        touched: Dict[Tuple[str, str], None] = {}
+        for message in messages:
+            try:
+                buffer_key = self._ingest(message)
+                if buffer_key is not None:
+                    touched[buffer_key] = None
+            except Exception as e:
+                print(f"Error processing kline: {e}")
+        
+        # Detection for different buffers overlaps in the thread pool
+        results = await asyncio.gather(*(self._detect(key) for key in touched), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Error processing kline: {result}")
+    
+    async def _enqueue(self, queue: asyncio.Queue, message: Dict) -> None:
+        """
+        Hand a closed kline to the consumer.
+        
+        In-progress kline updates (most of the traffic) never change a buffer,
+        so they are discarded here instead of taking queue space. Closed klines
+        are never dropped: when the queue is full the reader waits for the
+        consumer, and further frames wait in the socket's receive buffer.
+        
+        Args:
+            queue: Queue drained by _consume()
+            message: WebSocket message
+        """
+        kline = message.get('data', {}).get('k')
+        if not kline or not kline.get('x', False):
+            return
+        await queue.put(message)
+    
+    async def _consume(self, queue: asyncio.Queue) -> None:
+        """
+        Drain the message queue forever, processing whatever has accumulated as one batch.
+        
+        Args:
+            queue: Queue filled by _enqueue()
+        """
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            
+            await self.process_batch(batch)
+    
     async def connect_and_listen(self, send_historical: bool = False) -> None:
         """
         Connect to WebSocket and listen for messages.
@@ -494,6 +1037,40 @@ class BinanceWebSocketClient:
         print(f"Monitoring {len(self.symbols)} symbols on {len(self.timeframes)} timeframes")
         print()
         
+        # The socket reader only parses and enqueues; detection runs in the consumer task
+        queue: asyncio.Queue = asyncio.Queue(maxsize=config.WS_QUEUE_MAX)
+        consumer = asyncio.create_task(self._consume(queue))
+        # Telegram sends run in their own task so they never delay kline processing
+        self._notify_queue = asyncio.Queue(maxsize=config.WS_NOTIFY_QUEUE_MAX)
+        sender = asyncio.create_task(self._notify_worker(self._notify_queue))
+        
+        try:
+            await self._listen(url, queue)
+        finally:
+            consumer.cancel()
+            await asyncio.gather(consumer, return_exceptions=True)
+            
+            # Let the sender deliver what detection already queued; anything left
+            # unsent was never marked seen and is picked up again after a restart
+            try:
+                await asyncio.wait_for(self._notify_queue.join(), timeout=config.WS_NOTIFY_DRAIN_SEC)
+            except asyncio.TimeoutError:
+                print(f"Warning: {self._notify_queue.qsize()} notifications not sent before shutdown")
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+            self._notify_queue = None
+            
+            self._pool.shutdown(wait=False)
+            self.dedup_state.flush()
+    
+    async def _listen(self, url: str, queue: asyncio.Queue) -> None:
+        """
+        Read messages from the WebSocket into the queue, reconnecting on errors.
+        
+        Args:
+            url: Combined stream URL
+            queue: Queue drained by the consumer task
+        """
         retry_delay = 1
         max_retry_delay = 60
         
@@ -508,11 +1085,12 @@ class BinanceWebSocketClient:
                     # Reset retry delay on successful connection
                     retry_delay = 1
                     
-                    # Listen for messages
-                    async for message in websocket:
+                    # Listen for messages; take raw bytes so frames are never decoded to str first
+                    while True:
+                        message = await websocket.recv(decode=False)
                         try:
-                            data = json.loads(message)
-                            await self.process_kline(data)
+                            data = _loads(message)
+                            await self._enqueue(queue, data)
                         except json.JSONDecodeError as e:
                             print(f"Error decoding message: {e}")
                         except Exception as e:
@@ -561,7 +1139,11 @@ def main(send_historical: bool = False):
         send_historical: If True, send Telegram notifications for historical blocks on startup.
     """
     try:
-        asyncio.run(run_live_ws(send_historical=send_historical))
+        # uvloop's libuv-based loop handles socket IO with less overhead than the default loop
+        if uvloop is not None:
+            uvloop.run(run_live_ws(send_historical=send_historical))
+        else:
+            asyncio.run(run_live_ws(send_historical=send_historical))
     except KeyboardInterrupt:
         print("\n\nStopping live monitoring...")
 
@@ -3,85 +3,180 @@ Plotting module for visualizing order blocks on price charts.
 """
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
+from matplotlib.collections import LineCollection
+from matplotlib.path import Path
+import numpy as np
 from datetime import datetime
 
+from . import config
 
-def plot_with_blocks(df, blocks, symbol, timeframe, save_path=None):
+
+def _block_arrays(block_list):
+    """
+    Get block fields as parallel numpy arrays.
+    
+    Args:
+        block_list: BLOCK_DTYPE structured array or list of order block dicts
+        
+    Returns:
+        Tuple of (index, low, high, score, has_sweep) arrays
+    """
+    if isinstance(block_list, np.ndarray):
+        return (block_list['index'], block_list['low'], block_list['high'],
+                block_list['score'], block_list['has_sweep'])
+    
+    # Pull each field straight into its own array, without packing whole records
+    n = len(block_list)
+    return (
+        np.fromiter((b['index'] for b in block_list), dtype=np.int64, count=n),
+        np.fromiter((b['low'] for b in block_list), dtype=np.float64, count=n),
+        np.fromiter((b['high'] for b in block_list), dtype=np.float64, count=n),
+        np.fromiter((b.get('score', 0.5) for b in block_list), dtype=np.float64, count=n),
+        np.fromiter((b.get('has_sweep', False) for b in block_list), dtype=np.bool_, count=n),
+    )
+
+
+def _bodies_path(x, bottom, height, half_width=0.3):
+    """
+    Build a single compound path containing one closed rectangle per candle body.
+    
+    Args:
+        x: Array of candle x positions
+        bottom: Array of body bottoms
+        height: Array of body heights
+        half_width: Half of the body width
+        
+    Returns:
+        matplotlib.path.Path with 5 vertices per body
+    """
+    n = len(x)
+    left = x - half_width
+    right = x + half_width
+    top = bottom + height
+    
+    verts = np.empty((n, 5, 2))
+    verts[:, 0] = np.column_stack((left, bottom))
+    verts[:, 1] = np.column_stack((right, bottom))
+    verts[:, 2] = np.column_stack((right, top))
+    verts[:, 3] = np.column_stack((left, top))
+    verts[:, 4] = verts[:, 0]
+    
+    codes = np.tile([Path.MOVETO, Path.LINETO, Path.LINETO, Path.LINETO, Path.CLOSEPOLY], n)
+    return Path(verts.reshape(-1, 2), codes)
+
+
+def _trim_to_last_bars(df, blocks, max_bars):
+    """
+    Keep only the last `max_bars` candles and the blocks that fall inside them.
+    
+    Args:
+        df: pandas.DataFrame with OHLCV data
+        blocks: dict with 'bullish' and 'bearish' order blocks
+        max_bars: Maximum number of candles to keep
+        
+    Returns:
+        Tuple of (df, blocks) with block indices shifted to the trimmed frame
+    """
+    offset = len(df) - max_bars
+    df = df.iloc[-max_bars:].reset_index(drop=True)
+    
+    trimmed = {}
+    for side, block_list in blocks.items():
+        if isinstance(block_list, np.ndarray):
+            kept = block_list[block_list['index'] >= offset].copy()
+            kept['index'] -= offset
+        else:
+            kept = [{**b, 'index': b['index'] - offset} for b in block_list if b['index'] >= offset]
+        trimmed[side] = kept
+    return df, trimmed
+
+
+def plot_with_blocks(df, blocks, symbol, timeframe, save_path=None, max_bars=None):
     """
     Plot candlestick chart with order blocks highlighted.
     
     Args:
         df: pandas.DataFrame with OHLCV data
-        blocks: dict with 'bullish' and 'bearish' order block lists
+        blocks: dict with 'bullish' and 'bearish' order blocks, either lists of
+                dicts or BLOCK_DTYPE structured arrays
         symbol: Trading pair symbol (e.g., "BTC/USDT")
         timeframe: Timeframe string (e.g., "15m", "30m")
         save_path: Path to save the chart (optional)
+        max_bars: Only plot the most recent bars. None uses config.PLOT_MAX_BARS;
+                  0 or a negative value plots the full history.
+                  Larger charts are unreadable and each candle adds drawing work.
     """
+    if max_bars is None:
+        max_bars = config.PLOT_MAX_BARS
+    if 0 < max_bars < len(df):
+        df, blocks = _trim_to_last_bars(df, blocks, max_bars)
+    
     fig, ax = plt.subplots(figsize=(14, 8))
     
-    # Plot candlesticks
-    for i in range(len(df)):
-        row = df.iloc[i]
-        color = 'green' if row['close'] >= row['open'] else 'red'
-        
-        # Plot the wick
-        ax.plot([i, i], [row['low'], row['high']], color='black', linewidth=0.5)
-        
-        # Plot the body
-        body_height = abs(row['close'] - row['open'])
-        body_bottom = min(row['open'], row['close'])
-        rect = patches.Rectangle((i - 0.3, body_bottom), 0.6, body_height, 
-                                 linewidth=0.5, edgecolor='black', 
-                                 facecolor=color, alpha=0.7)
-        ax.add_patch(rect)
+    opens = df['open'].to_numpy(dtype=float)
+    highs = df['high'].to_numpy(dtype=float)
+    lows = df['low'].to_numpy(dtype=float)
+    closes = df['close'].to_numpy(dtype=float)
+    x = np.arange(len(df), dtype=float)
+    
+    # Plot candle wicks as a single LineCollection of vertical segments
+    wicks = np.empty((len(df), 2, 2))
+    wicks[:, 0, 0] = x
+    wicks[:, 1, 0] = x
+    wicks[:, 0, 1] = lows
+    wicks[:, 1, 1] = highs
+    ax.add_collection(LineCollection(wicks, colors='black', linewidths=0.5))
+    
+    # Plot candle bodies: one compound path per color instead of one patch per candle
+    body_bottom = np.minimum(opens, closes)
+    body_height = np.abs(closes - opens)
+    up = closes >= opens
+    for mask, color in ((up, 'green'), (~up, 'red')):
+        if not mask.any():
+            continue
+        path = _bodies_path(x[mask], body_bottom[mask], body_height[mask])
+        ax.add_patch(patches.PathPatch(path, linewidth=0.5, edgecolor='black',
+                                       facecolor=color, alpha=0.7))
     
     # Highlight bullish order blocks (green rectangles with score-based alpha)
-    for block in blocks['bullish']:
-        idx = block['index']
-        score = block.get('score', 0.5)
-        has_sweep = block.get('has_sweep', False)
-        
-        # Alpha based on score (min 0.2, max 0.6)
-        alpha = 0.2 + (score * 0.4)
-        
+    idx, low, high, score, sweep = _block_arrays(blocks['bullish'])
+    # Alpha based on score (min 0.2, max 0.6)
+    alpha = 0.2 + (score * 0.4)
+    mid_price = (low + high) / 2
+    for i in range(len(idx)):
         # Edge color and width based on sweep detection
-        edge_color = 'lime' if has_sweep else 'darkgreen'
-        edge_width = 3 if has_sweep else 2
+        edge_color = 'lime' if sweep[i] else 'darkgreen'
+        edge_width = 3 if sweep[i] else 2
         
-        block_rect = patches.Rectangle((idx - 0.5, block['low']), 1, 
-                                      block['high'] - block['low'],
+        block_rect = patches.Rectangle((idx[i] - 0.5, low[i]), 1, 
+                                      high[i] - low[i],
                                       linewidth=edge_width, edgecolor=edge_color, 
-                                      facecolor='lightgreen', alpha=alpha)
+                                      facecolor='lightgreen', alpha=float(alpha[i]))
         ax.add_patch(block_rect)
         
         # Add score annotation
-        mid_price = (block['low'] + block['high']) / 2
-        ax.text(idx, mid_price, f"{score:.2f}", 
+        ax.text(idx[i], mid_price[i], f"{score[i]:.2f}", 
                fontsize=8, ha='center', va='center',
                bbox=dict(boxstyle='round,pad=0.3', facecolor='white', alpha=0.7))
     
     # Highlight bearish order blocks (red rectangles with score-based alpha)
-    for block in blocks['bearish']:
-        idx = block['index']
-        score = block.get('score', 0.5)
-        has_sweep = block.get('has_sweep', False)
-        
-        # Alpha based on score (min 0.2, max 0.6)
-        alpha = 0.2 + (score * 0.4)
-        
+    idx, low, high, score, sweep = _block_arrays(blocks['bearish'])
+    # Alpha based on score (min 0.2, max 0.6)
+    alpha = 0.2 + (score * 0.4)
+    mid_price = (low + high) / 2
+    for i in range(len(idx)):
         # Edge color and width based on sweep detection
-        edge_color = 'orangered' if has_sweep else 'darkred'
-        edge_width = 3 if has_sweep else 2
+        edge_color = 'orangered' if sweep[i] else 'darkred'
+        edge_width = 3 if sweep[i] else 2
         
-        block_rect = patches.Rectangle((idx - 0.5, block['low']), 1, 
-                                      block['high'] - block['low'],
+        block_rect = patches.Rectangle((idx[i] - 0.5, low[i]), 1, 
+                                      high[i] - low[i],
                                       linewidth=edge_width, edgecolor=edge_color, 
-                                      facecolor='lightcoral', alpha=alpha)
+                                      facecolor='lightcoral', alpha=float(alpha[i]))
         ax.add_patch(block_rect)
         
         # Add score annotation
-        mid_price = (block['low'] + block['high']) / 2
-        ax.text(idx, mid_price, f"{score:.2f}", 
+        ax.text(idx[i], mid_price[i], f"{score[i]:.2f}", 
                fontsize=8, ha='center', va='center',
                bbox=dict(boxstyle='round,pad=0.3', facecolor='white', alpha=0.7))
     
@@ -3,10 +3,62 @@
 State persistence module for order block detection.
 Provides generic helper functions for loading and saving state to JSON files.
 """
+import contextlib
 import json
 import os
 import tempfile
-from typing import Any, Dict
+import threading
+import warnings
+from typing import Any, Dict, Iterator, Set
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Without orjson, state files go through the stdlib json module, which silently
+# falls back to a much slower pure-Python codec when its C extension is missing
+if orjson is None and (getattr(json.encoder, 'c_make_encoder', None) is None
+                       or getattr(json.scanner, 'c_make_scanner', None) is None):
+    warnings.warn("orjson is not installed and the json C accelerator is unavailable; "
+                  "state files will be encoded and decoded in pure Python", RuntimeWarning)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# Parent directories save_bytes() has already created or found, so it skips the check
+_known_dirs: Set[str] = set()
+
+# Per-thread count of `<path>.lock` locks currently held, keyed by absolute path,
+# so a save or batch nested inside a batch on the same path doesn't wait on itself
+_held_locks = threading.local()
+
+
+def _dumps(state: Dict[str, Any]) -> bytes:
+    """Encode state as compact JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(state, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(state, separators=(',', ':')).encode('utf-8')
+
+
+def _loads(data: bytes) -> Any:
+    """Decode JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _read_bytes(path: str) -> bytes:
+    """Return the current contents of `path`, or empty bytes if it doesn't exist."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return b''
 
 
 def load_state(path: str) -> Dict[str, Any]:
@@ -20,33 +72,102 @@ def load_state(path: str) -> Dict[str, Any]:
         Dictionary containing the state, or empty dict if file doesn't exist
         or contains invalid JSON
     """
-    if not os.path.exists(path):
+    raw = _read_bytes(path)
+    if not raw.strip():
+        # Missing or empty file
         return {}
     
     try:
-        with open(path, 'r') as f:
-            return json.load(f)
+        return _loads(raw)
     except json.JSONDecodeError:
         # Return empty dict if file is corrupted
         return {}
 
 
-def save_state(path: str, state: Dict[str, Any]) -> None:
+@contextlib.contextmanager
+def _exclusive_lock(path: str) -> Iterator[None]:
     """
-    Save state to a JSON file with atomic write operation.
-    Creates parent directories if they don't exist.
+    Hold an exclusive advisory lock on `<path>.lock` for the duration of the block.
+    
+    The lock is re-entrant within a thread: if this thread already holds it,
+    the block runs without locking again.
     
     Args:
-        path: Path to the state file
-        state: Dictionary to save as JSON
-        
-    Raises:
-        IOError: If there's an error writing the file
+        path: Path to the state file being protected
+    """
+    held = getattr(_held_locks, 'depth', None)
+    if held is None:
+        held = _held_locks.depth = {}
+    key = os.path.abspath(path)
+    if held.get(key):
+        held[key] += 1
+        try:
+            yield
+        finally:
+            held[key] -= 1
+        return
+    
+    try:
+        lock_fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+    except FileNotFoundError:
+        # The directory was removed since it was cached as known; create it again
+        _ensure_parent_dir(path, recheck=True)
+        lock_fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        else:
+            # msvcrt locks a byte range; lock the first byte of the lock file
+            msvcrt.locking(lock_fd, msvcrt.LK_LOCK, 1)
+        held[key] = 1
+        try:
+            yield
+        finally:
+            del held[key]
+            if fcntl is not None:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(lock_fd, 0, os.SEEK_SET)
+                msvcrt.locking(lock_fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(lock_fd)
+
+
+def _ensure_parent_dir(path: str, recheck: bool = False) -> None:
+    """
+    Create the directory holding `path` if it doesn't exist (checked once per directory).
+    
+    Args:
+        path: Path to a file
+        recheck: Create the directory even if it was already seen, e.g. after a
+                 write failed because it was removed in the meantime
     """
-    # Create parent directory if it doesn't exist
     parent_dir = os.path.dirname(path)
-    if parent_dir and not os.path.exists(parent_dir):
+    if recheck:
+        _known_dirs.discard(parent_dir)
+    if parent_dir and parent_dir not in _known_dirs:
         os.makedirs(parent_dir, exist_ok=True)
+        _known_dirs.add(parent_dir)
+
+
+def _replace_file(path: str, payload: bytes, skip_unchanged: bool = True) -> None:
+    """
+    Atomically replace `path` with `payload`; the caller must hold `_exclusive_lock(path)`.
+    
+    Args:
+        path: Path to the file
+        payload: Bytes to store
+        skip_unchanged: Skip the write if the file already holds the same payload
+    """
+    # Nothing to do if another writer (or a previous call) already stored this payload;
+    # the size is compared first so differing payloads never read the old file
+    if skip_unchanged:
+        try:
+            same_size = os.stat(path).st_size == len(payload)
+        except FileNotFoundError:
+            same_size = False
+        if same_size and _read_bytes(path) == payload:
+            return
     
     # Atomic write: write to temp file first, then rename
     # This prevents corruption if the process is interrupted
@@ -55,16 +176,99 @@ def save_state(path: str, state: Dict[str, Any]) -> None:
     
     # Create a temporary file in the same directory as the target
     # This ensures the rename operation is atomic (same filesystem)
-    with tempfile.NamedTemporaryFile(
-        mode='w',
-        dir=dir_name,
-        prefix=f'.{file_name}.',
-        suffix='.tmp',
-        delete=False
-    ) as tmp_file:
-        tmp_path = tmp_file.name
-        json.dump(state, tmp_file, indent=2)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=f'.{file_name}.', suffix='.tmp')
+    except FileNotFoundError:
+        # The directory was removed since it was cached as known; create it again
+        _ensure_parent_dir(path, recheck=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=f'.{file_name}.', suffix='.tmp')
+    try:
+        # One write syscall for the whole payload, flushed to disk before the rename
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view):]
+        os.fsync(fd)
+    except BaseException:
+        os.close(fd)
+        os.unlink(tmp_path)
+        raise
+    os.close(fd)
     
     # Atomic rename: replaces the old file if it exists
     # This is atomic on POSIX systems
     os.replace(tmp_path, path)
+    
+    # The rename itself is only durable once the directory entry is flushed
+    if os.name == 'posix':
+        dir_fd = os.open(dir_name, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def save_bytes(path: str, payload: bytes, skip_unchanged: bool = True) -> None:
+    """
+    Atomically replace `path` with `payload`.
+    Creates parent directories if they don't exist.
+    
+    Concurrent writers are serialized with an advisory lock on `<path>.lock`,
+    and by default the write is skipped entirely if the file already holds
+    the same payload.
+    
+    Args:
+        path: Path to the file
+        payload: Bytes to store
+        skip_unchanged: Compare against the current file first; callers that
+                        only save known-changed data pass False to skip the read
+                        
+    Raises:
+        IOError: If there's an error writing the file
+    """
+    _ensure_parent_dir(path)
+    with _exclusive_lock(path):
+        _replace_file(path, payload, skip_unchanged)
+
+
+def save_state(path: str, state: Dict[str, Any]) -> None:
+    """
+    Save state to a JSON file with atomic write operation.
+    Creates parent directories if they don't exist.
+    
+    See save_bytes() for the locking and unchanged-payload behaviour.
+    
+    Args:
+        path: Path to the state file
+        state: Dictionary to save as JSON
+        
+    Raises:
+        IOError: If there's an error writing the file
+    """
+    save_bytes(path, _dumps(state))
+
+
+@contextlib.contextmanager
+def batch(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Group several updates to a state file into a single save.
+    
+    Yields the current state as a dict; changes made to it inside the block
+    are written with a single atomic replace when the block exits normally,
+    and discarded if it raises. The `<path>.lock` lock is held from the load
+    to the write, so other writers wait instead of being overwritten.
+    
+    The lock is re-entrant, so calling save_state() or batch() on the same
+    path inside the block doesn't deadlock; the outer block's state is still
+    written last when it exits, replacing whatever the nested call saved.
+    
+    Args:
+        path: Path to the state file
+        
+    Yields:
+        Mutable dictionary holding the state
+    """
+    _ensure_parent_dir(path)
+    with _exclusive_lock(path):
+        data = load_state(path)
+        yield data
+        _replace_file(path, _dumps(data))
@@ -0,0 +1,8 @@
+"""
+Shared pytest configuration.
+"""
+import os
+import sys
+
+# Make the `src` package importable from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
@@ -2,15 +2,10 @@
 Unit tests for order block detection module.
 Tests the advanced detection algorithm with synthetic data.
 """
-import sys
-import os
 import pytest
 import pandas as pd
 import numpy as np
 
-# Add parent directory to path to import src modules
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
-
 from src import detection
 from src import config
 
@@ -333,6 +328,20 @@ class TestZoneDetection:
         assert 0 <= zone['score'] <= 1.0
         assert 'touches' in zone
         assert 'has_sweep' in zone
+    
+    def test_detection_window_keeps_live_zones(self):
+        """Test that detecting on the trailing window finds every unexpired zone."""
+        df = create_synthetic_ohlcv(n_bars=400)
+        offset = len(df) - detection.detection_window()
+        
+        full_zones = detection.detect_order_zones(df)
+        window_zones = detection.detect_order_zones(df.iloc[offset:].reset_index(drop=True))
+        for zone in window_zones:
+            zone['index'] += offset
+        
+        assert full_zones
+        for zone in full_zones:
+            assert zone in window_zones
 
 
 class TestBackwardCompatibility:
@@ -358,6 +367,33 @@ class TestBackwardCompatibility:
             assert 'high' in block
             assert 'type' in block
             assert 'score' in block
+    
+    def test_detect_order_blocks_as_array(self):
+        """Test that as_array returns structured arrays matching the dict format."""
+        df = create_bullish_pattern()
+        
+        blocks = detection.detect_order_blocks(df)
+        arrays = detection.detect_order_blocks(df, as_array=True)
+        
+        for side in ('bullish', 'bearish'):
+            assert isinstance(arrays[side], np.ndarray)
+            assert arrays[side].dtype == detection.BLOCK_DTYPE
+            assert len(arrays[side]) == len(blocks[side])
+            assert [b['index'] for b in blocks[side]] == arrays[side]['index'].tolist()
+    
+    def test_blocks_array_round_trip(self):
+        """Test packing block dicts into an array and back."""
+        blocks = [
+            {'index': 10, 'low': 100.5, 'high': 105.25, 'type': 'bullish',
+             'score': 0.75, 'touches': 2, 'has_sweep': True},
+            {'index': 20, 'low': 120.0, 'high': 125.0, 'type': 'bearish',
+             'score': 0.5, 'touches': 1, 'has_sweep': False},
+        ]
+        
+        arr = detection.blocks_to_array(blocks)
+        
+        assert arr['low'].tolist() == [100.5, 120.0]
+        assert detection.array_to_blocks(arr) == blocks
 
 
 class TestZoneMerging:
@@ -1,19 +1,44 @@
 """
 Unit tests for WebSocket-based live detection module.
 """
-import sys
+import asyncio
 import os
 import pytest
 import json
-import tempfile
 import pandas as pd
 from unittest.mock import Mock, patch, MagicMock
 
-# Add parent directory to path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
-
 from src import live_ws
 from src import config
+from tests.test_detection import create_synthetic_ohlcv
+
+
+@pytest.fixture(autouse=True)
+def isolated_state_file(tmp_path, monkeypatch):
+    """Keep dedup state written by clients out of the working directory."""
+    monkeypatch.setattr(config, 'STATE_FILE', str(tmp_path / 'state.json'))
+
+
+@pytest.fixture(scope="class")
+def shared_client(tmp_path_factory):
+    """One client shared by the read-only tests of a class."""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(config, 'STATE_FILE', str(tmp_path_factory.mktemp('shared') / 'state.json'))
+        yield live_ws.BinanceWebSocketClient(["BTC/USDT", "ETH/USDT"], ["15m", "30m"])
+
+
+# Closed klines one minute apart with increasing prices, as sent by Binance
+KLINE_ROWS = [
+    {
+        't': 1609459200000 + i * 60000,
+        'o': str(29000 + i),
+        'h': str(29100 + i),
+        'l': str(28900 + i),
+        'c': str(29050 + i),
+        'v': '100.0'
+    }
+    for i in range(50)
+]
 
 
 class TestKlineBuffer:
@@ -23,7 +48,7 @@ class TestKlineBuffer:
         """Test buffer initialization."""
         buffer = live_ws.KlineBuffer(max_candles=100)
         assert buffer.max_candles == 100
-        assert len(buffer.klines) == 0
+        assert len(buffer) == 0
         assert not buffer.is_ready()
     
     def test_add_kline(self):
@@ -40,29 +65,85 @@ class TestKlineBuffer:
         }
         
         buffer.add_kline(kline_data)
-        assert len(buffer.klines) == 1
-        assert buffer.klines[0]['open'] == 29000.0
-        assert buffer.klines[0]['high'] == 29100.0
+        assert len(buffer) == 1
+        df = buffer.get_dataframe()
+        assert df.iloc[0]['open'] == 29000.0
+        assert df.iloc[0]['high'] == 29100.0
+    
+    def test_add_parsed_kline(self):
+        """Test adding a kline parsed from a WebSocket payload."""
+        buffer = live_ws.KlineBuffer(max_candles=5)
+        
+        kline = live_ws.Kline.from_ws({
+            't': 1609459200000, 'o': '29000.00', 'h': '29100.00',
+            'l': '28900.00', 'c': '29050.00', 'v': '100.5', 'x': True
+        })
+        assert kline.close == 29050.0
+        assert kline.is_closed
+        
+        buffer.add_kline(kline)
+        df = buffer.get_dataframe()
+        assert df.iloc[0]['low'] == 28900.0
+        assert df.iloc[0]['volume'] == 100.5
     
     def test_buffer_max_size(self):
         """Test that buffer respects max size."""
         buffer = live_ws.KlineBuffer(max_candles=3)
         
         # Add more than max_candles
-        for i in range(5):
-            kline_data = {
-                't': 1609459200000 + i * 60000,
-                'o': f'{29000 + i}.00',
-                'h': f'{29100 + i}.00',
-                'l': f'{28900 + i}.00',
-                'c': f'{29050 + i}.00',
-                'v': '100.0'
-            }
-            buffer.add_kline(kline_data)
+        buffer.add_klines_bulk(KLINE_ROWS[:5])
         
         # Should only keep last 3
-        assert len(buffer.klines) == 3
-        assert buffer.klines[0]['open'] == 29002.0  # 3rd added
+        assert len(buffer) == 3
+        assert buffer.get_dataframe().iloc[0]['open'] == 29002.0  # 3rd added
+    
+    def test_buffer_wraparound_order(self):
+        """Test that the ring buffer returns candles oldest first after wrapping."""
+        buffer = live_ws.KlineBuffer(max_candles=4)
+        
+        for i in range(10):
+            buffer.add_kline({
+                't': 1609459200000 + i * 60000,
+                'o': str(i),
+                'h': str(i + 1),
+                'l': str(i - 1),
+                'c': str(i),
+                'v': '1.0'
+            })
+        
+        df = buffer.get_dataframe()
+        assert df['open'].tolist() == [6.0, 7.0, 8.0, 9.0]
+        assert df['timestamp'].is_monotonic_increasing
+        assert df.iloc[-1]['timestamp'] == pd.to_datetime(1609459200000 + 9 * 60000, unit='ms')
+    
+    def test_add_klines_bulk_matches_add_kline(self):
+        """Test that bulk insertion leaves the ring in the same state as single inserts."""
+        single = live_ws.KlineBuffer(max_candles=7)
+        bulk = live_ws.KlineBuffer(max_candles=7)
+        
+        for row in KLINE_ROWS[:4]:
+            single.add_kline(row)
+        bulk.add_klines_bulk(KLINE_ROWS[:4])
+        
+        # Wraps mid-array, then a batch longer than the buffer
+        for rows in (KLINE_ROWS[4:9], KLINE_ROWS[9:30]):
+            for row in rows:
+                single.add_kline(row)
+            bulk.add_klines_bulk(rows)
+            pd.testing.assert_frame_equal(bulk.get_dataframe(), single.get_dataframe())
+    
+    def test_add_dataframe_round_trip(self):
+        """Test that a fetched-style DataFrame loads back out unchanged."""
+        source = live_ws.KlineBuffer(max_candles=50)
+        source.add_klines_bulk(KLINE_ROWS)
+        df = source.get_dataframe()
+        
+        buffer = live_ws.KlineBuffer(max_candles=20)
+        buffer.add_dataframe(df)
+        
+        # Only the newest rows fit
+        assert len(buffer) == 20
+        pd.testing.assert_frame_equal(buffer.get_dataframe(), df.iloc[-20:].reset_index(drop=True))
     
     def test_get_dataframe(self):
         """Test converting buffer to DataFrame."""
@@ -95,124 +176,224 @@ class TestKlineBuffer:
         
         # Add enough klines
         min_required = config.ATR_PERIOD + config.DETECTION_LOOKAHEAD + 1
-        for i in range(min_required):
-            kline_data = {
-                't': 1609459200000 + i * 60000,
-                'o': f'{29000 + i}.00',
-                'h': f'{29100 + i}.00',
-                'l': f'{28900 + i}.00',
-                'c': f'{29050 + i}.00',
-                'v': '100.0'
-            }
-            buffer.add_kline(kline_data)
+        assert buffer.min_required == min_required
+        buffer.add_klines_bulk(KLINE_ROWS[:min_required - 1])
+        assert not buffer.is_ready()
+        buffer.add_kline(KLINE_ROWS[min_required - 1])
         
         # Should be ready now
         assert buffer.is_ready()
+        
+        # A buffer smaller than min_required never holds enough rows to be ready
+        small = live_ws.KlineBuffer(max_candles=min_required - 1)
+        for row in KLINE_ROWS[:min_required + 5]:
+            small.add_kline(row)
+        assert len(small) == min_required - 1
+        assert not small.is_ready()
 
 
 class TestDeduplicationState:
     """Test DeduplicationState class."""
     
-    def test_initialization(self):
+    def test_initialization(self, tmp_path):
         """Test state initialization."""
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as f:
-            state_file = f.name
-        
-        try:
-            state = live_ws.DeduplicationState(state_file)
-            assert len(state.seen_blocks) == 0
-            assert len(state.seen_set) == 0
-        finally:
-            if os.path.exists(state_file):
-                os.remove(state_file)
-    
-    def test_mark_and_check_seen(self):
+        state = live_ws.DeduplicationState(str(tmp_path / 'state.json'))
+        assert len(state.seen_blocks) == 0
+        assert len(state.seen_set) == 0
+    
+    def test_mark_and_check_seen(self, tmp_path):
         """Test marking and checking seen blocks."""
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as f:
-            state_file = f.name
+        state = live_ws.DeduplicationState(str(tmp_path / 'state.json'))
         
-        try:
-            state = live_ws.DeduplicationState(state_file)
-            
-            block_key = "BTC/USDT|15m|100|bullish|0.75"
-            
-            # Initially not seen
-            assert not state.is_seen(block_key)
-            
-            # Mark as seen
-            state.mark_seen(block_key)
-            
-            # Should now be seen
-            assert state.is_seen(block_key)
-            assert len(state.seen_blocks) == 1
-            assert len(state.seen_set) == 1
-        finally:
-            if os.path.exists(state_file):
-                os.remove(state_file)
-    
-    def test_persistence(self):
+        block_key = "BTC/USDT|15m|100|bullish|0.75"
+        
+        # Initially not seen
+        assert not state.is_seen(block_key)
+        
+        # Mark as seen
+        state.mark_seen(block_key)
+        
+        # Should now be seen
+        assert state.is_seen(block_key)
+        assert len(state.seen_blocks) == 1
+        assert len(state.seen_set) == 1
+    
+    def test_make_block_key(self):
+        """Test the dedup key format shared by live and preload paths."""
+        assert live_ws.make_block_key("BTC/USDT", "15m", 100, "bullish", 0.7512) == "BTC/USDT|15m|100|bullish|0.75"
+        assert live_ws.make_block_key("BTC/USDT", "15m", 15, "bearish", 0.6) == "BTC/USDT|15m|15|bearish|0.6"
+    
+    def test_persistence(self, tmp_path):
         """Test state persistence across restarts."""
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as f:
-            state_file = f.name
-        
-        try:
-            # Create state and mark block as seen
-            state1 = live_ws.DeduplicationState(state_file)
-            block_key = "BTC/USDT|15m|100|bullish|0.75"
-            state1.mark_seen(block_key)
-            
-            # Create new state instance (simulating restart)
-            state2 = live_ws.DeduplicationState(state_file)
-            
-            # Should still be seen
-            assert state2.is_seen(block_key)
-            assert len(state2.seen_blocks) == 1
-            assert len(state2.seen_set) == 1
-        finally:
-            if os.path.exists(state_file):
-                os.remove(state_file)
-    
-    def test_prune_old_entries(self):
+        state_file = str(tmp_path / 'state.json')
+        
+        # Create state and mark block as seen
+        state1 = live_ws.DeduplicationState(state_file)
+        block_key = "BTC/USDT|15m|100|bullish|0.75"
+        state1.mark_seen(block_key)
+        
+        # Create new state instance (simulating restart)
+        state2 = live_ws.DeduplicationState(state_file)
+        
+        # Should still be seen
+        assert state2.is_seen(block_key)
+        assert len(state2.seen_blocks) == 1
+        assert len(state2.seen_set) == 1
+    
+    def test_in_memory_state(self, tmp_path, monkeypatch):
+        """Test that ':memory:' state works without touching the filesystem."""
+        monkeypatch.chdir(tmp_path)
+        state = live_ws.DeduplicationState(':memory:')
+        
+        state.mark_seen("block_0")
+        state.save_state()
+        
+        assert state.is_seen("block_0")
+        assert list(tmp_path.iterdir()) == []
+    
+    def test_prune_old_entries(self, tmp_path):
         """Test pruning old entries using FIFO."""
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as f:
-            state_file = f.name
+        state = live_ws.DeduplicationState(str(tmp_path / 'state.json'))
         
-        try:
-            state = live_ws.DeduplicationState(state_file)
-            
-            # Add many entries
-            for i in range(150):
+        # Add many entries
+        for i in range(150):
+            state.mark_seen(f"block_{i}")
+        
+        assert len(state.seen_blocks) == 150
+        assert len(state.seen_set) == 150
+        
+        # Remember the first and last blocks
+        first_block = "block_0"
+        last_block = "block_149"
+        
+        # Prune to 100 (should remove oldest 50)
+        state.prune_old_entries(max_entries=100)
+        
+        # Should have exactly 100 entries
+        assert len(state.seen_blocks) == 100
+        assert len(state.seen_set) == 100
+        
+        # First 50 blocks should be removed (FIFO)
+        assert first_block not in state.seen_set
+        assert "block_49" not in state.seen_set
+        
+        # Last 100 blocks should remain
+        assert "block_50" in state.seen_set
+        assert last_block in state.seen_set
+        
+        # Pruned blocks are still reported as seen via the Bloom filter
+        assert state.is_seen(first_block)
+        assert state.is_seen("block_49")
+    
+    def test_mark_seen_auto_prunes(self, tmp_path, monkeypatch):
+        """Test that exceeding STATE_MAX_ENTRIES prunes down to STATE_PRUNE_TO."""
+        monkeypatch.setattr(config, 'STATE_MAX_ENTRIES', 10)
+        monkeypatch.setattr(config, 'STATE_PRUNE_TO', 8)
+        state = live_ws.DeduplicationState(str(tmp_path / 'state.json'))
+        
+        for i in range(10):
+            state.mark_seen(f"block_{i}")
+        assert len(state) == 10
+        
+        state.mark_seen("block_10")
+        assert state.seen_blocks == [f"block_{i}" for i in range(3, 11)]
+        assert state.is_seen("block_0")  # via the Bloom filter
+    
+    def test_pruned_entries_survive_restart(self, tmp_path):
+        """Test that pruned blocks are persisted in the Bloom filter file."""
+        state_file = str(tmp_path / 'state.json')
+        state = live_ws.DeduplicationState(state_file)
+        
+        for i in range(20):
+            state.mark_seen(f"block_{i}")
+        state.prune_old_entries(max_entries=10)
+        assert os.path.exists(state.bloom_file)
+        
+        state2 = live_ws.DeduplicationState(state_file)
+        assert len(state2.seen_blocks) == 10
+        assert all(state2.is_seen(f"block_{i}") for i in range(20))
+        assert not state2.is_seen("block_never_marked")
+    
+    def test_empty_bloom_filter_skips_hashing(self, tmp_path, monkeypatch):
+        """Test that lookups miss without hashing until a key is pruned into the filter."""
+        state_file = str(tmp_path / 'state.json')
+        state = live_ws.DeduplicationState(state_file)
+        state.mark_seen("block_0")
+        
+        with monkeypatch.context() as mp:
+            mp.setattr(live_ws.BloomFilter, '_positions', Mock(side_effect=AssertionError))
+            assert not state.is_seen("block_1")
+        
+        state.prune_old_entries(max_entries=0)
+        assert not state._bloom.empty
+        
+        # A reloaded non-empty filter is probed again
+        state2 = live_ws.DeduplicationState(state_file)
+        assert not state2._bloom.empty
+        assert state2.is_seen("block_0")
+    
+    def test_mark_seen_appends_to_log(self, tmp_path):
+        """Test that marking a block appends to the log instead of rewriting the snapshot."""
+        state_file = str(tmp_path / 'state.json')
+        state = live_ws.DeduplicationState(state_file)
+        
+        for i in range(3):
+            state.mark_seen(f"block_{i}")
+        
+        # Keys are only in the write-ahead log until the next snapshot
+        assert not os.path.exists(state_file)
+        with open(state.log_file, 'r') as f:
+            assert f.read().splitlines() == ["block_0", "block_1", "block_2"]
+        
+        # A snapshot folds the log into the state file and removes it
+        state.save_state()
+        assert os.path.exists(state_file)
+        assert not os.path.exists(state.log_file)
+        
+        state2 = live_ws.DeduplicationState(state_file)
+        assert list(state2.seen_blocks) == ["block_0", "block_1", "block_2"]
+    
+    def test_snapshot_after_threshold(self, tmp_path, monkeypatch):
+        """Test that a snapshot is written once enough blocks were marked."""
+        monkeypatch.setattr(config, 'STATE_SNAPSHOT_EVERY', 5)
+        state_file = str(tmp_path / 'state.json')
+        state = live_ws.DeduplicationState(state_file)
+        
+        for i in range(4):
+            state.mark_seen(f"block_{i}")
+        assert not os.path.exists(state_file)
+        
+        state.mark_seen("block_4")
+        assert os.path.exists(state_file)
+        assert not os.path.exists(state.log_file)
+    
+    def test_flush_coalesces(self, tmp_path):
+        """Test that many marks are persisted with a single snapshot on flush."""
+        state = live_ws.DeduplicationState(str(tmp_path / 'state.json'))
+        
+        with patch.object(live_ws.state, 'save_state', wraps=live_ws.state.save_state) as mock_save:
+            for i in range(config.STATE_SNAPSHOT_EVERY - 1):
                 state.mark_seen(f"block_{i}")
+            assert mock_save.call_count == 0
             
-            assert len(state.seen_blocks) == 150
-            assert len(state.seen_set) == 150
-            
-            # Remember the first and last blocks
-            first_block = "block_0"
-            last_block = "block_149"
-            
-            # Prune to 100 (should remove oldest 50)
-            state.prune_old_entries(max_entries=100)
-            
-            # Should have exactly 100 entries
-            assert len(state.seen_blocks) == 100
-            assert len(state.seen_set) == 100
-            
-            # First 50 blocks should be removed (FIFO)
-            assert not state.is_seen(first_block)
-            assert not state.is_seen("block_49")
-            
-            # Last 100 blocks should remain
-            assert state.is_seen("block_50")
-            assert state.is_seen(last_block)
-        finally:
-            if os.path.exists(state_file):
-                os.remove(state_file)
+            state.flush()
+            state.flush()  # Nothing new, so no second write
+            assert mock_save.call_count == 1
+        
+        assert len(live_ws.DeduplicationState(state.state_file)) == config.STATE_SNAPSHOT_EVERY - 1
 
 
 class TestBinanceWebSocketClient:
     """Test BinanceWebSocketClient class."""
     
+    @pytest.fixture(autouse=True)
+    def live_mocks(self, monkeypatch):
+        """Stub detection and Telegram for every test in the class."""
+        self.mock_detect = Mock(return_value={'bullish': [], 'bearish': []})
+        self.mock_send = Mock()
+        monkeypatch.setattr(live_ws.detection, 'detect_order_blocks', self.mock_detect)
+        monkeypatch.setattr(live_ws.notifier, 'send_telegram', self.mock_send)
+    
     def test_initialization(self):
         """Test client initialization."""
         symbols = ["BTC/USDT", "ETH/USDT"]
@@ -230,13 +411,9 @@ class TestBinanceWebSocketClient:
         
         assert client.dedup_state.state_file == config.STATE_FILE
     
-    def test_get_stream_names(self):
+    def test_get_stream_names(self, shared_client):
         """Test stream name generation."""
-        symbols = ["BTC/USDT", "ETH/USDT"]
-        timeframes = ["15m", "30m"]
-        
-        client = live_ws.BinanceWebSocketClient(symbols, timeframes)
-        streams = client.get_stream_names()
+        streams = shared_client.get_stream_names()
         
         assert len(streams) == 4
         assert "btcusdt@kline_15m" in streams
@@ -244,33 +421,23 @@ class TestBinanceWebSocketClient:
         assert "ethusdt@kline_15m" in streams
         assert "ethusdt@kline_30m" in streams
     
-    def test_get_websocket_url(self):
+    def test_get_websocket_url(self, shared_client):
         """Test WebSocket URL generation."""
-        symbols = ["BTC/USDT"]
-        timeframes = ["15m"]
-        
-        client = live_ws.BinanceWebSocketClient(symbols, timeframes)
-        url = client.get_websocket_url()
+        url = shared_client.get_websocket_url()
         
         assert url.startswith("wss://stream.binance.com:9443/stream?streams=")
         assert "btcusdt@kline_15m" in url
+        assert "ethusdt@kline_30m" in url
     
-    def test_parse_symbol_from_stream(self):
+    @pytest.mark.parametrize("stream_name,expected", [
+        ("btcusdt@kline_15m", ("BTC/USDT", "15m")),
+        ("ethusdt@kline_30m", ("ETH/USDT", "30m")),
+        # Not subscribed, but parsed from the name for a known symbol
+        ("btcusdt@kline_1h", ("BTC/USDT", "1h")),
+    ])
+    def test_parse_symbol_from_stream(self, shared_client, stream_name, expected):
         """Test parsing symbol from stream name."""
-        symbols = ["BTC/USDT", "ETH/USDT"]
-        timeframes = ["15m"]
-        
-        client = live_ws.BinanceWebSocketClient(symbols, timeframes)
-        
-        # Test valid stream
-        symbol, timeframe = client.parse_symbol_from_stream("btcusdt@kline_15m")
-        assert symbol == "BTC/USDT"
-        assert timeframe == "15m"
-        
-        # Test another valid stream
-        symbol, timeframe = client.parse_symbol_from_stream("ethusdt@kline_30m")
-        assert symbol == "ETH/USDT"
-        assert timeframe == "30m"
+        assert shared_client.parse_symbol_from_stream(stream_name) == expected
     
     def test_parse_symbol_invalid_stream(self):
         """Test parsing invalid stream name."""
@@ -284,18 +451,13 @@ class TestBinanceWebSocketClient:
             client.parse_symbol_from_stream("invalid_stream")
     
     @pytest.mark.asyncio
-    @patch('src.live_ws.detection.detect_order_blocks')
-    @patch('src.live_ws.notifier.send_telegram')
-    async def test_process_kline_closed(self, mock_send_telegram, mock_detect):
+    async def test_process_kline_closed(self):
         """Test processing closed kline."""
         symbols = ["BTC/USDT"]
         timeframes = ["15m"]
         
         client = live_ws.BinanceWebSocketClient(symbols, timeframes)
         
-        # Mock detection to return no blocks
-        mock_detect.return_value = {'bullish': [], 'bearish': []}
-        
         # Create a closed kline message
         message = {
             'stream': 'btcusdt@kline_15m',
@@ -316,12 +478,35 @@ class TestBinanceWebSocketClient:
         
         # Verify kline was added to buffer
         buffer = client.buffers[("BTC/USDT", "15m")]
-        assert len(buffer.klines) == 1
+        assert len(buffer) == 1
     
     @pytest.mark.asyncio
-    @patch('src.live_ws.detection.detect_order_blocks')
-    @patch('src.live_ws.notifier.send_telegram')
-    async def test_process_kline_not_closed(self, mock_send_telegram, mock_detect):
+    async def test_process_kline_duplicate_ignored(self):
+        """Test that a resent closing frame for the same candle is ignored."""
+        client = live_ws.BinanceWebSocketClient(["BTC/USDT"], ["15m"])
+        
+        message = {
+            'stream': 'btcusdt@kline_15m',
+            'data': {
+                'k': {
+                    't': 1609459200000,
+                    'o': '29000.00',
+                    'h': '29100.00',
+                    'l': '28900.00',
+                    'c': '29050.00',
+                    'v': '100.5',
+                    'x': True
+                }
+            }
+        }
+        
+        await client.process_kline(message)
+        await client.process_kline(message)
+        
+        assert len(client.buffers[("BTC/USDT", "15m")]) == 1
+    
+    @pytest.mark.asyncio
+    async def test_process_kline_not_closed(self):
         """Test that unclosed klines are ignored."""
         symbols = ["BTC/USDT"]
         timeframes = ["15m"]
@@ -348,16 +533,14 @@ class TestBinanceWebSocketClient:
         
         # Verify kline was NOT added to buffer
         buffer = client.buffers[("BTC/USDT", "15m")]
-        assert len(buffer.klines) == 0
+        assert len(buffer) == 0
         
         # Detection should not have been called
-        mock_detect.assert_not_called()
+        self.mock_detect.assert_not_called()
     
     @pytest.mark.asyncio
-    @patch('src.live_ws.detection.detect_order_blocks')
-    @patch('src.live_ws.notifier.send_telegram')
     @patch('src.live_ws.notifier.format_block_message')
-    async def test_score_filtering(self, mock_format, mock_send_telegram, mock_detect):
+    async def test_score_filtering(self, mock_format):
         """Test that blocks below score threshold are filtered."""
         symbols = ["BTC/USDT"]
         timeframes = ["15m"]
@@ -382,7 +565,7 @@ class TestBinanceWebSocketClient:
             client.buffers[("BTC/USDT", "15m")].add_kline(kline_data)
         
         # Mock detection to return blocks with different scores
-        mock_detect.return_value = {
+        self.mock_detect.return_value = {
             'bullish': [
                 {'index': 100, 'type': 'bullish', 'score': 0.10},  # Below threshold
                 {'index': 101, 'type': 'bullish', 'score': 0.25},  # At threshold
@@ -414,7 +597,153 @@ class TestBinanceWebSocketClient:
         
         # Only blocks with score >= WS_NOTIFY_SCORE_MIN should be notified
         # That's 2 blocks (0.25 and 0.75)
-        assert mock_send_telegram.call_count == 2
+        assert self.mock_send.call_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_notifications_go_through_sender_queue(self):
+        """Test that a running listener queues notifications and marks blocks seen once sent."""
+        client = live_ws.BinanceWebSocketClient(["BTC/USDT"], ["15m"])
+        client.buffers[("BTC/USDT", "15m")].add_klines_bulk(KLINE_ROWS[:30])
+        self.mock_detect.return_value = {
+            'bullish': [{'index': 5, 'type': 'bullish', 'score': 0.75, 'low': 1.0, 'high': 2.0}],
+            'bearish': []
+        }
+        client._notify_queue = asyncio.Queue()
+        
+        await client._detect(("BTC/USDT", "15m"))
+        # A second scan before the send must not queue the block again
+        await client._detect(("BTC/USDT", "15m"))
+        
+        # Detection returns before anything is sent, and the block isn't seen yet
+        self.mock_send.assert_not_called()
+        assert client._notify_queue.qsize() == 1
+        assert not client.dedup_state.is_seen("BTC/USDT|15m|5|bullish|0.75")
+        
+        sender = asyncio.create_task(client._notify_worker(client._notify_queue))
+        await asyncio.wait_for(client._notify_queue.join(), timeout=1)
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
+        
+        self.mock_send.assert_called_once()
+        assert client.dedup_state.is_seen("BTC/USDT|15m|5|bullish|0.75")
+    
+    @pytest.mark.asyncio
+    async def test_full_notification_queue_retries_next_scan(self):
+        """Test that a notification dropped on a full queue is not marked seen."""
+        client = live_ws.BinanceWebSocketClient(["BTC/USDT"], ["15m"])
+        client.buffers[("BTC/USDT", "15m")].add_klines_bulk(KLINE_ROWS[:30])
+        self.mock_detect.return_value = {
+            'bullish': [{'index': 5, 'type': 'bullish', 'score': 0.75, 'low': 1.0, 'high': 2.0}],
+            'bearish': []
+        }
+        client._notify_queue = asyncio.Queue(maxsize=1)
+        client._notify_queue.put_nowait(("other", "Other message"))
+        
+        await client._detect(("BTC/USDT", "15m"))
+        assert not client.dedup_state.is_seen("BTC/USDT|15m|5|bullish|0.75")
+        
+        # Once there is room, the next scan queues it
+        client._notify_queue.get_nowait()
+        client._notify_queue.task_done()
+        await client._detect(("BTC/USDT", "15m"))
+        assert client._notify_queue.get_nowait()[0] == "BTC/USDT|15m|5|bullish|0.75"
+    
+    @pytest.mark.asyncio
+    async def test_shutdown_sends_queued_notifications(self, monkeypatch):
+        """Test that connect_and_listen() drains the notification queue before exiting."""
+        client = live_ws.BinanceWebSocketClient(["BTC/USDT"], ["15m"])
+        monkeypatch.setattr(client, 'preload_historical_data', Mock())
+        
+        async def listen(url, queue):
+            assert client._queue_notification("BTC/USDT|15m|5|bullish|0.75", "Test message")
+        monkeypatch.setattr(client, '_listen', listen)
+        
+        await client.connect_and_listen()
+        
+        self.mock_send.assert_called_once_with("Test message")
+        assert client.dedup_state.is_seen("BTC/USDT|15m|5|bullish|0.75")
+        assert client._notify_queue is None
+    
+    @pytest.mark.asyncio
+    async def test_process_batch_detects_once_per_buffer(self):
+        """Test that a batch of klines runs detection once per touched buffer."""
+        symbols = ["BTC/USDT", "ETH/USDT"]
+        timeframes = ["15m"]
+        
+        client = live_ws.BinanceWebSocketClient(symbols, timeframes)
+        
+        messages = []
+        for stream in ('btcusdt@kline_15m', 'ethusdt@kline_15m'):
+            for i in range(30):
+                messages.append({
+                    'stream': stream,
+                    'data': {'k': {
+                        't': 1609459200000 + i * 60000,
+                        'o': '29000.00', 'h': '29100.00', 'l': '28900.00',
+                        'c': '29050.00', 'v': '100.0', 'x': True
+                    }}
+                })
+        
+        await client.process_batch(messages)
+        
+        assert len(client.buffers[("BTC/USDT", "15m")]) == 30
+        assert len(client.buffers[("ETH/USDT", "15m")]) == 30
+        assert self.mock_detect.call_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_process_batch_skips_unready_buffers(self):
+        """Test that a batch too short to warm up a buffer never calls detection."""
+        client = live_ws.BinanceWebSocketClient(["BTC/USDT"], ["15m"])
+        
+        messages = [{
+            'stream': 'btcusdt@kline_15m',
+            'data': {'k': {
+                't': 1609459200000 + i * 60000,
+                'o': '29000.00', 'h': '29100.00', 'l': '28900.00',
+                'c': '29050.00', 'v': '100.0', 'x': True
+            }}
+        } for i in range(10)]
+        
+        await client.process_batch(messages)
+        
+        assert len(client.buffers[("BTC/USDT", "15m")]) == 10
+        self.mock_detect.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_enqueue_skips_open_klines(self):
+        """Test that in-progress kline updates never reach the queue."""
+        client = live_ws.BinanceWebSocketClient(["BTC/USDT"], ["15m"])
+        queue = asyncio.Queue()
+        
+        await client._enqueue(queue, {'stream': 'btcusdt@kline_15m', 'data': {'k': dict(KLINE_ROWS[0], x=False)}})
+        await client._enqueue(queue, {'stream': 'btcusdt@kline_15m', 'data': {}})
+        
+        assert queue.empty()
+    
+    @pytest.mark.asyncio
+    async def test_full_queue_delivers_every_closed_kline(self):
+        """Test that a full queue holds the reader back instead of losing closed klines."""
+        client = live_ws.BinanceWebSocketClient(["BTC/USDT"], ["15m"])
+        queue = asyncio.Queue(maxsize=2)
+        
+        messages = []
+        for row in KLINE_ROWS[:6]:
+            messages.append({'stream': 'btcusdt@kline_15m', 'data': {'k': dict(row, x=False)}})
+            messages.append({'stream': 'btcusdt@kline_15m', 'data': {'k': dict(row, x=True)}})
+        
+        async def reader():
+            for message in messages:
+                await client._enqueue(queue, message)
+        
+        task = asyncio.create_task(reader())
+        received = []
+        while len(received) < 6:
+            received.append(await asyncio.wait_for(queue.get(), timeout=1))
+        await task
+        
+        assert [m['data']['k']['t'] for m in received] == [row['t'] for row in KLINE_ROWS[:6]]
+        assert all(m['data']['k']['x'] for m in received)
+        assert queue.empty()
 
 
 class TestHistoricalPreloading:
@@ -431,12 +760,12 @@ class TestHistoricalPreloading:
         # Mock successful API response
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = [
+        mock_response.content = json.dumps([
             [1609459200000, '29000', '29100', '28900', '29050', '100.5', 
              1609459259999, '2905000', 100, '50', '1452500', '0'],
             [1609459260000, '29050', '29150', '28950', '29100', '110.2',
              1609459319999, '3205000', 120, '60', '1763000', '0']
-        ]
+        ]).encode()
         mock_get.return_value = mock_response
         
         # Fetch historical data
@@ -465,6 +794,10 @@ class TestHistoricalPreloading:
         assert df['low'].dtype == float
         assert df['close'].dtype == float
         assert df['volume'].dtype == float
+        
+        # Verify values survive the conversion
+        assert df['timestamp'].iloc[0] == pd.Timestamp('2021-01-01 00:00:00')
+        assert df['close'].tolist() == [29050.0, 29100.0]
     
     @patch('src.live_ws.requests.get')
     def test_fetch_historical_klines_error(self, mock_get):
@@ -519,7 +852,7 @@ class TestHistoricalPreloading:
         
         # Verify buffer was populated
         buffer = client.buffers[("BTC/USDT", "15m")]
-        assert len(buffer.klines) == 30
+        assert len(buffer) == 30
         
         # Verify no notifications were sent
         mock_send_telegram.assert_not_called()
@@ -527,6 +860,40 @@ class TestHistoricalPreloading:
         # Verify block was marked as seen
         assert client.dedup_state.is_seen("BTC/USDT|15m|10|bullish|0.75")
     
+    @patch('src.live_ws.detection.detect_order_blocks')
+    @patch('src.live_ws.BinanceWebSocketClient.fetch_historical_klines')
+    def test_preload_fetches_every_stream(self, mock_fetch, mock_detect):
+        """Test that the concurrent preload fetches and fills every buffer."""
+        symbols = ["BTC/USDT", "ETH/USDT"]
+        timeframes = ["15m", "30m"]
+        
+        client = live_ws.BinanceWebSocketClient(symbols, timeframes)
+        
+        # Each stream gets its own close price so buffers can be told apart
+        def fetch(symbol, timeframe, limit):
+            close = 100.0 * (symbols.index(symbol) + 1) + timeframes.index(timeframe)
+            return pd.DataFrame({
+                'timestamp': pd.date_range('2024-01-01', periods=5, freq='15min'),
+                'open': [close] * 5,
+                'high': [close] * 5,
+                'low': [close] * 5,
+                'close': [close] * 5,
+                'volume': [1.0] * 5
+            })
+        mock_fetch.side_effect = fetch
+        
+        client.preload_historical_data(send_historical=False)
+        
+        assert mock_fetch.call_count == 4
+        for symbol in symbols:
+            for timeframe in timeframes:
+                expected = 100.0 * (symbols.index(symbol) + 1) + timeframes.index(timeframe)
+                df = client.buffers[(symbol, timeframe)].get_dataframe()
+                assert df['close'].tolist() == [expected] * 5
+        
+        # Five bars are not enough for detection
+        mock_detect.assert_not_called()
+    
     @patch('src.live_ws.notifier.send_telegram')
     @patch('src.live_ws.notifier.format_block_message')
     @patch('src.live_ws.detection.detect_order_blocks')
@@ -572,6 +939,25 @@ class TestHistoricalPreloading:
         assert client.dedup_state.is_seen("BTC/USDT|15m|10|bullish|0.75")
         assert client.dedup_state.is_seen("BTC/USDT|15m|15|bearish|0.6")
     
+    @pytest.mark.asyncio
+    @patch('src.live_ws.notifier.send_telegram')
+    @patch('src.live_ws.BinanceWebSocketClient.fetch_historical_klines')
+    async def test_preload_and_live_scan_agree(self, mock_fetch, mock_send_telegram, monkeypatch):
+        """Test that preload and a live scan of the same bars produce the same dedup keys."""
+        monkeypatch.setattr(config, 'STATE_FILE', ':memory:')
+        df = create_synthetic_ohlcv(n_bars=400)
+        mock_fetch.return_value = df
+        
+        preloaded = live_ws.BinanceWebSocketClient(["BTC/USDT"], ["15m"])
+        preloaded.preload_historical_data(send_historical=False)
+        
+        live = live_ws.BinanceWebSocketClient(["BTC/USDT"], ["15m"])
+        live.buffers[("BTC/USDT", "15m")].add_dataframe(df)
+        await live._detect(("BTC/USDT", "15m"))
+        
+        assert preloaded.dedup_state.seen_blocks
+        assert live.dedup_state.seen_blocks == preloaded.dedup_state.seen_blocks
+    
     @patch('src.live_ws.notifier.send_telegram')
     @patch('src.live_ws.detection.detect_order_blocks')
     @patch('src.live_ws.BinanceWebSocketClient.fetch_historical_klines')
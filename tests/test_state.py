@@ -1,208 +1,321 @@
 """
 Unit tests for state persistence module.
 """
-import sys
 import os
+import pathlib
+import shutil
+import stat
+import threading
 import pytest
 import json
-import tempfile
-import shutil
-
-# Add parent directory to path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from unittest.mock import Mock
 
 from src import state
 
 
+@pytest.fixture(scope='module')
+def shared_tmpdir(tmp_path_factory):
+    """One temporary directory for the whole module; tests keep apart by file name."""
+    return tmp_path_factory.mktemp('state_tests')
+
+
+@pytest.fixture
+def state_path(shared_tmpdir, request):
+    """Path of a state file unique to the current test."""
+    return str(shared_tmpdir / f'{request.node.name}.json')
+
+
 class TestLoadState:
     """Test load_state function."""
     
-    def test_load_nonexistent_file(self):
+    def test_load_nonexistent_file(self, state_path):
         """Test loading from a non-existent file returns empty dict."""
-        with tempfile.TemporaryDirectory() as tmpdir:
-            path = os.path.join(tmpdir, 'nonexistent.json')
-            result = state.load_state(path)
-            assert result == {}
+        result = state.load_state(state_path)
+        assert result == {}
     
-    def test_load_valid_json(self):
+    def test_load_valid_json(self, state_path):
         """Test loading valid JSON file."""
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as f:
-            test_data = {'key': 'value', 'number': 42}
+        test_data = {'key': 'value', 'number': 42}
+        with open(state_path, 'w') as f:
             json.dump(test_data, f)
-            f.flush()
-            path = f.name
         
-        try:
-            result = state.load_state(path)
-            assert result == test_data
-        finally:
-            os.remove(path)
+        result = state.load_state(state_path)
+        assert result == test_data
     
-    def test_load_corrupted_json(self):
+    def test_load_corrupted_json(self, state_path):
         """Test loading corrupted JSON returns empty dict."""
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as f:
+        with open(state_path, 'w') as f:
             f.write('{ invalid json ]}')
-            f.flush()
-            path = f.name
         
-        try:
-            result = state.load_state(path)
-            assert result == {}
-        finally:
-            os.remove(path)
+        result = state.load_state(state_path)
+        assert result == {}
     
-    def test_load_empty_file(self):
+    def test_load_empty_file(self, state_path):
         """Test loading empty file returns empty dict."""
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as f:
-            path = f.name
-        
-        try:
-            result = state.load_state(path)
-            assert result == {}
-        finally:
-            os.remove(path)
+        open(state_path, 'w').close()
+        
+        result = state.load_state(state_path)
+        assert result == {}
 
 
 class TestSaveState:
     """Test save_state function."""
     
-    def test_save_simple_dict(self):
+    def test_save_simple_dict(self, state_path):
         """Test saving a simple dictionary."""
-        with tempfile.TemporaryDirectory() as tmpdir:
-            path = os.path.join(tmpdir, 'state.json')
-            test_data = {'key': 'value', 'number': 42}
-            
-            state.save_state(path, test_data)
-            
-            # Verify file exists
-            assert os.path.exists(path)
-            
-            # Verify content
-            with open(path, 'r') as f:
-                loaded_data = json.load(f)
-            assert loaded_data == test_data
+        test_data = {'key': 'value', 'number': 42}
+        
+        state.save_state(state_path, test_data)
+        
+        # Verify file exists
+        assert os.path.exists(state_path)
+        
+        # Verify content
+        loaded_data = json.loads(pathlib.Path(state_path).read_bytes())
+        assert loaded_data == test_data
     
-    def test_save_creates_parent_directory(self):
+    def test_save_creates_parent_directory(self, state_path):
         """Test that save_state creates parent directories."""
-        with tempfile.TemporaryDirectory() as tmpdir:
-            path = os.path.join(tmpdir, 'nested', 'dir', 'state.json')
-            test_data = {'key': 'value'}
-            
-            # Parent directories don't exist yet
-            assert not os.path.exists(os.path.dirname(path))
-            
-            state.save_state(path, test_data)
-            
-            # Parent directories should be created
-            assert os.path.exists(os.path.dirname(path))
-            assert os.path.exists(path)
-            
-            # Verify content
-            with open(path, 'r') as f:
-                loaded_data = json.load(f)
-            assert loaded_data == test_data
+        path = os.path.join(os.path.splitext(state_path)[0], 'nested', 'dir', 'state.json')
+        test_data = {'key': 'value'}
+        
+        # Parent directories don't exist yet
+        assert not os.path.exists(os.path.dirname(path))
+        
+        state.save_state(path, test_data)
+        
+        # Parent directories should be created
+        assert os.path.exists(os.path.dirname(path))
+        assert os.path.exists(path)
+        
+        # Verify content
+        loaded_data = json.loads(pathlib.Path(path).read_bytes())
+        assert loaded_data == test_data
     
-    def test_save_overwrites_existing(self):
+    def test_save_checks_parent_directory_once(self, state_path, monkeypatch):
+        """Test that repeated saves into the same directory skip the makedirs call."""
+        path = os.path.join(os.path.splitext(state_path)[0], 'state.json')
+        calls = []
+        original_makedirs = os.makedirs
+        monkeypatch.setattr(os, 'makedirs', lambda *a, **kw: calls.append(a[0]) or original_makedirs(*a, **kw))
+        
+        for i in range(3):
+            state.save_state(path, {'iteration': i})
+        
+        assert calls == [os.path.dirname(path)]
+        assert state.load_state(path) == {'iteration': 2}
+    
+    def test_save_recreates_removed_directory(self, state_path):
+        """Test that a save succeeds after the cached parent directory was deleted."""
+        path = os.path.join(os.path.splitext(state_path)[0], 'state.json')
+        state.save_state(path, {'iteration': 0})
+        
+        shutil.rmtree(os.path.dirname(path))
+        state.save_state(path, {'iteration': 1})
+        
+        assert state.load_state(path) == {'iteration': 1}
+    
+    def test_save_overwrites_existing(self, state_path):
         """Test that save_state overwrites existing file."""
-        with tempfile.TemporaryDirectory() as tmpdir:
-            path = os.path.join(tmpdir, 'state.json')
-            
-            # Save initial data
-            initial_data = {'key': 'initial'}
-            state.save_state(path, initial_data)
-            
-            # Save new data
-            new_data = {'key': 'updated', 'new_key': 'new_value'}
-            state.save_state(path, new_data)
-            
-            # Verify new data
-            with open(path, 'r') as f:
-                loaded_data = json.load(f)
-            assert loaded_data == new_data
-    
-    def test_save_complex_data(self):
+        # Save initial data
+        initial_data = {'key': 'initial'}
+        state.save_state(state_path, initial_data)
+        
+        # Save new data
+        new_data = {'key': 'updated', 'new_key': 'new_value'}
+        state.save_state(state_path, new_data)
+        
+        # Verify new data
+        loaded_data = json.loads(pathlib.Path(state_path).read_bytes())
+        assert loaded_data == new_data
+    
+    def test_save_complex_data(self, state_path):
         """Test saving complex nested data structures."""
-        with tempfile.TemporaryDirectory() as tmpdir:
-            path = os.path.join(tmpdir, 'state.json')
-            test_data = {
-                'string': 'value',
-                'number': 42,
-                'float': 3.14,
-                'boolean': True,
-                'null': None,
-                'list': [1, 2, 3],
-                'nested': {
-                    'inner': 'value',
-                    'deep': {
-                        'deeper': 'nested'
-                    }
+        test_data = {
+            'string': 'value',
+            'number': 42,
+            'float': 3.14,
+            'boolean': True,
+            'null': None,
+            'list': [1, 2, 3],
+            'nested': {
+                'inner': 'value',
+                'deep': {
+                    'deeper': 'nested'
                 }
             }
-            
-            state.save_state(path, test_data)
-            
-            # Verify content
-            with open(path, 'r') as f:
-                loaded_data = json.load(f)
-            assert loaded_data == test_data
+        }
+        
+        state.save_state(state_path, test_data)
+        
+        # Verify content
+        loaded_data = json.loads(pathlib.Path(state_path).read_bytes())
+        assert loaded_data == test_data
     
-    def test_atomic_write(self):
+    def test_atomic_write(self, state_path):
         """Test that save_state uses atomic write."""
-        with tempfile.TemporaryDirectory() as tmpdir:
-            path = os.path.join(tmpdir, 'state.json')
-            
-            # Save initial data
-            initial_data = {'version': 1}
-            state.save_state(path, initial_data)
-            
-            # Verify initial data
-            with open(path, 'r') as f:
-                content = f.read()
-            assert 'version' in content
-            assert '"version": 1' in content
-            
-            # Save new data
-            new_data = {'version': 2, 'updated': True}
-            state.save_state(path, new_data)
-            
-            # Verify file was atomically replaced (no intermediate state visible)
-            with open(path, 'r') as f:
-                loaded_data = json.load(f)
-            assert loaded_data == new_data
+        # Save initial data
+        initial_data = {'version': 1}
+        state.save_state(state_path, initial_data)
+        
+        # Verify initial data
+        assert json.loads(pathlib.Path(state_path).read_bytes()) == initial_data
+        
+        # Save new data
+        new_data = {'version': 2, 'updated': True}
+        state.save_state(state_path, new_data)
+        
+        # Verify file was atomically replaced (no intermediate state visible)
+        loaded_data = json.loads(pathlib.Path(state_path).read_bytes())
+        assert loaded_data == new_data
+    
+    def test_save_skips_reading_differently_sized_file(self, state_path, monkeypatch):
+        """Test that a payload of a different size replaces the file without reading it."""
+        state.save_state(state_path, {'key': 'value'})
+        monkeypatch.setattr(state, '_read_bytes', Mock(side_effect=AssertionError))
+        
+        state.save_state(state_path, {'key': 'longer value'})
+        
+        assert json.loads(pathlib.Path(state_path).read_bytes()) == {'key': 'longer value'}
+    
+    @pytest.mark.skipif(os.name != 'posix', reason="directory fsync is POSIX-only")
+    def test_save_fsyncs_file_and_directory(self, state_path, monkeypatch):
+        """Test that both the temp file and its directory are flushed to disk."""
+        synced = []
+        original_fsync = os.fsync
+        monkeypatch.setattr(os, 'fsync', lambda fd: synced.append(stat.S_ISDIR(os.fstat(fd).st_mode)) or original_fsync(fd))
+        
+        state.save_state(state_path, {'key': 'value'})
+        
+        assert synced == [False, True]
+    
+    def test_save_uses_lock_file(self, state_path):
+        """Test that save_state serializes writers through a sidecar lock file."""
+        state.save_state(state_path, {'key': 'value'})
+        
+        assert os.path.exists(state_path + '.lock')
+    
+    def test_save_skips_unchanged_payload(self, state_path):
+        """Test that saving an identical payload does not rewrite the file."""
+        test_data = {'key': 'value'}
+        
+        state.save_state(state_path, test_data)
+        inode_before = os.stat(state_path).st_ino
+        
+        state.save_state(state_path, test_data)
+        
+        # Same inode means no temp file was renamed over the target
+        assert os.stat(state_path).st_ino == inode_before
+        assert state.load_state(state_path) == test_data
 
 
 class TestRoundTrip:
     """Test load and save together."""
     
-    def test_save_and_load(self):
+    def test_save_and_load(self, state_path):
         """Test saving and then loading the same data."""
-        with tempfile.TemporaryDirectory() as tmpdir:
-            path = os.path.join(tmpdir, 'state.json')
-            test_data = {
-                'seen_blocks': ['block1', 'block2', 'block3'],
-                'last_updated': '2024-01-01T00:00:00',
-                'count': 3
-            }
-            
-            # Save
-            state.save_state(path, test_data)
-            
-            # Load
-            loaded_data = state.load_state(path)
-            
-            # Verify
-            assert loaded_data == test_data
+        test_data = {
+            'seen_blocks': ['block1', 'block2', 'block3'],
+            'last_updated': '2024-01-01T00:00:00',
+            'count': 3
+        }
+        
+        # Save
+        state.save_state(state_path, test_data)
+        
+        # Load
+        loaded_data = state.load_state(state_path)
+        
+        # Verify
+        assert loaded_data == test_data
+    
+    def test_save_and_load_without_orjson(self, state_path, monkeypatch):
+        """Test that the stdlib json fallback produces the same round trip."""
+        monkeypatch.setattr(state, 'orjson', None)
+        test_data = {'seen_blocks': ['block1', 'block2'], 'count': 2}
+        
+        state.save_state(state_path, test_data)
+        
+        assert state.load_state(state_path) == test_data
     
-    def test_multiple_save_load_cycles(self):
+    def test_multiple_save_load_cycles(self, state_path):
         """Test multiple save/load cycles."""
-        with tempfile.TemporaryDirectory() as tmpdir:
-            path = os.path.join(tmpdir, 'state.json')
-            
-            for i in range(5):
-                test_data = {'iteration': i, 'data': f'test_{i}'}
-                state.save_state(path, test_data)
-                loaded_data = state.load_state(path)
-                assert loaded_data == test_data
+        for i in range(5):
+            test_data = {'iteration': i, 'data': f'test_{i}'}
+            state.save_state(state_path, test_data)
+            loaded_data = state.load_state(state_path)
+            assert loaded_data == test_data
+    
+    def test_batch_saves_once(self, state_path, monkeypatch):
+        """Test that updates inside batch() are written with a single save."""
+        state.save_state(state_path, {'keep': True})
+        
+        calls = []
+        original_replace = state._replace_file
+        monkeypatch.setattr(state, '_replace_file', lambda p, b: calls.append(p) or original_replace(p, b))
+        
+        with state.batch(state_path) as s:
+            s['x'] = 1
+            s['y'] = 2
+            del s['keep']
+        
+        assert calls == [state_path]
+        assert state.load_state(state_path) == {'x': 1, 'y': 2}
+    
+    def test_batch_discards_on_error(self, state_path):
+        """Test that a batch interrupted by an exception leaves the file untouched."""
+        state.save_state(state_path, {'count': 1})
+        
+        with pytest.raises(RuntimeError):
+            with state.batch(state_path) as s:
+                s['count'] = 2
+                raise RuntimeError("boom")
+        
+        assert state.load_state(state_path) == {'count': 1}
+    
+    def test_batch_blocks_concurrent_writers(self, state_path):
+        """Test that a writer arriving during an open batch waits instead of being overwritten."""
+        state.save_state(state_path, {'count': 0})
+        
+        def increment():
+            with state.batch(state_path) as s:
+                s['count'] += 1
+        
+        with state.batch(state_path) as s:
+            other = threading.Thread(target=increment)
+            other.start()
+            # Give the other writer time to load and save if it weren't blocked
+            other.join(timeout=0.2)
+            assert other.is_alive()
+            s['count'] += 1
+        
+        other.join(timeout=5)
+        assert not other.is_alive()
+        assert state.load_state(state_path) == {'count': 2}
+    
+    def test_batch_allows_nested_writes_to_same_path(self, state_path):
+        """Test that save_state() and batch() on the same path inside a batch don't deadlock."""
+        def nested():
+            with state.batch(state_path) as s:
+                state.save_state(state_path, {'inner': True})
+                with state.batch(state_path) as inner:
+                    assert inner == {'inner': True}
+                s['outer'] = True
+        
+        worker = threading.Thread(target=nested, daemon=True)
+        worker.start()
+        worker.join(timeout=5)
+        assert not worker.is_alive()
+        
+        # The outer batch is written last
+        assert state.load_state(state_path) == {'outer': True}
+        
+        # The lock is released again once the outer batch exits
+        other = threading.Thread(target=state.save_state, args=(state_path, {'after': 1}))
+        other.start()
+        other.join(timeout=5)
+        assert not other.is_alive()
+        assert state.load_state(state_path) == {'after': 1}
 
 
 if __name__ == '__main__':